@@ -0,0 +1,41 @@
+"""notification_meta_data_json
+
+Revision ID: b7e3d91c4a2f
+Revises: ce09c5aea835
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3d91c4a2f'
+down_revision: Union[str, None] = 'ce09c5aea835'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing values were written with json.dumps, so they cast cleanly
+    op.alter_column(
+        'notifications',
+        'meta_data',
+        type_=sa.JSON(),
+        existing_type=sa.Text(),
+        existing_nullable=True,
+        postgresql_using='meta_data::json',
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'notifications',
+        'meta_data',
+        type_=sa.Text(),
+        existing_type=sa.JSON(),
+        existing_nullable=True,
+        postgresql_using='meta_data::text',
+    )
@@ -11,6 +11,7 @@ class Settings(BaseSettings):
     openai_api_key: Optional[str] = None  # For chat command parsing
     openai_model: str = "gpt-4-turbo"  # Model for chat command parsing (GPT-4 for better function calling)
     encryption_key: Optional[str] = None  # For encrypting/decrypting API keys
+    model_cache_dir: Optional[str] = None  # Provider model-list cache shared by workers (default: temp dir)
     
     # Stripe Configuration
     stripe_secret_key: Optional[str] = None  # Stripe secret key (sk_test_... or sk_live_...)
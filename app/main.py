@@ -7,6 +7,7 @@ from app.database import async_engine, Base
 from app.routers import auth, dashboard, notifications, projects, billing
 from app.routers import llm_providers, wrapped_apis, wrap_x, oauth
 from app.config import settings
+from app.services.http_client import close_http_client
 import app.models  # Import all models
 import logging
 import os
@@ -35,6 +36,12 @@ async def startup_event():
     logger.info("Wrap-X API started successfully")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close shared outbound HTTP clients"""
+    await close_http_client()
+
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     """Handle validation errors with detailed messages"""
@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -14,7 +15,7 @@ class Notification(Base):
     title = Column(String, nullable=False)
     message = Column(Text, nullable=True)
     is_read = Column(Boolean, default=False)
-    meta_data = Column(Text, nullable=True)  # JSON metadata
+    meta_data = Column(JSON, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
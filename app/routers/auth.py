@@ -81,7 +81,7 @@ async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
         
         # Send email confirmation
         try:
-            email_service.send_template_email(
+            email_service.queue_template_email(
                 to_email=new_user.email,
                 template_name="email_confirmation.html",
                 subject="Confirm Your Wrap-X Account",
@@ -317,7 +317,7 @@ async def forgot_password(
         
         # Send password reset email
         try:
-            email_service.send_template_email(
+            email_service.queue_template_email(
                 to_email=user.email,
                 template_name="password_reset.html",
                 subject="Reset Your Wrap-X Password",
@@ -407,7 +407,7 @@ async def change_password(
     
     # Send password changed email
     try:
-        email_service.send_template_email(
+        email_service.queue_template_email(
             to_email=current_user.email,
             template_name="password_changed.html",
             subject="Your Wrap-X Password Has Been Changed",
@@ -478,7 +478,7 @@ async def verify_email(
         
         # Send welcome email
         try:
-            email_service.send_template_email(
+            email_service.queue_template_email(
                 to_email=user.email,
                 template_name="welcome.html",
                 subject="Welcome to Wrap-X!",
@@ -548,7 +548,7 @@ async def resend_verification(
         
         # Send verification email
         try:
-            email_service.send_template_email(
+            email_service.queue_template_email(
                 to_email=user.email,
                 template_name="email_confirmation.html",
                 subject="Confirm Your Wrap-X Account",
@@ -588,7 +588,7 @@ async def delete_account(
     try:
         # Send account deletion confirmation email before deletion
         try:
-            email_service.send_template_email(
+            email_service.queue_template_email(
                 to_email=current_user.email,
                 template_name="account_deleted.html",
                 subject="Your Wrap-X Account Has Been Deleted",
@@ -175,7 +175,7 @@ async def stripe_webhook(request: Request):
                         # Send subscription activated email
                         try:
                             plan_name = PLANS.get(billing.plan_type, {}).get("name", billing.plan_type.title())
-                            email_service.send_template_email(
+                            email_service.queue_template_email(
                                 to_email=user.email,
                                 template_name="subscription_activated.html",
                                 subject="Your Wrap-X Subscription is Active!",
@@ -204,7 +204,7 @@ async def stripe_webhook(request: Request):
                         # Send subscription renewed email
                         try:
                             plan_name = PLANS.get(billing.plan_type, {}).get("name", billing.plan_type.title())
-                            email_service.send_template_email(
+                            email_service.queue_template_email(
                                 to_email=user.email,
                                 template_name="subscription_renewed.html",
                                 subject="Your Wrap-X Subscription Has Been Renewed",
@@ -234,7 +234,7 @@ async def stripe_webhook(request: Request):
                         if user:
                             try:
                                 plan_name = PLANS.get(billing.plan_type, {}).get("name", billing.plan_type.title())
-                                email_service.send_template_email(
+                                email_service.queue_template_email(
                                     to_email=user.email,
                                     template_name="subscription_cancelled.html",
                                     subject="Your Wrap-X Subscription Has Been Cancelled",
@@ -269,7 +269,7 @@ async def stripe_webhook(request: Request):
                         user = result.scalar_one_or_none()
                         if user:
                             try:
-                                email_service.send_template_email(
+                                email_service.queue_template_email(
                                     to_email=user.email,
                                     template_name="payment_succeeded.html",
                                     subject="Payment Successful - Wrap-X",
@@ -307,7 +307,7 @@ async def stripe_webhook(request: Request):
                         user = result.scalar_one_or_none()
                         if user:
                             try:
-                                email_service.send_template_email(
+                                email_service.queue_template_email(
                                     to_email=user.email,
                                     template_name="payment_failed.html",
                                     subject="Payment Failed - Wrap-X",
@@ -16,6 +16,7 @@ from app.schemas.llm_provider import (
 )
 from app.auth.dependencies import get_current_active_user
 from app.services.notification_service import create_notification
+from app.services.model_catalog import invalidate_cache as invalidate_model_cache
 import litellm
 import logging
 from cryptography.fernet import Fernet
@@ -364,6 +365,7 @@ async def delete_llm_provider(
         
         await db.delete(provider)
         await db.commit()
+        invalidate_model_cache(provider_id)
         
         return {"message": "LLM provider deleted successfully"}
     except HTTPException:
@@ -812,7 +812,7 @@ async def send_config_chat_message(
         # If available_models were not provided by the UI, try to fetch dynamically
         if not current_config.get("available_models") and wrapped_api.provider_id:
             try:
-                current_config["available_models"] = get_available_models(prov_obj)
+                current_config["available_models"] = await get_available_models(prov_obj)
             except Exception as _e:
                 # Silent fallback; the prompt will ask user to pick from UI
                 current_config["available_models"] = None
@@ -1308,7 +1308,7 @@ async def list_provider_models(
     if not provider:
         raise HTTPException(status_code=404, detail="Provider not found")
     try:
-        return get_available_models(provider)
+        return await get_available_models(provider)
     except Exception as e:
         logger.error(f"Model list fetch error: {e}")
         # Empty list on failure; UI can prompt user to paste model id
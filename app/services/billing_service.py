@@ -58,7 +58,7 @@ async def create_trial_subscription(user: User, db: AsyncSession) -> Billing:
         
         # Send trial activated email
         try:
-            email_service.send_template_email(
+            email_service.queue_template_email(
                 to_email=user.email,
                 template_name="trial_activated.html",
                 subject="Your Wrap-X Free Trial Has Started!",
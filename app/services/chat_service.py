@@ -6,19 +6,25 @@ Enhanced to support:
 - Thinking and web search preferences
 - Tool scaffold for web search with LiteLLM function-calling
 """
+import asyncio
 import json
 import logging
 import re
 import os
+import time
 import urllib.request
 import urllib.parse
-from urllib.error import URLError, HTTPError
-from typing import Optional, Dict, Any, List
+import uuid
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple
+import httpx
 import openai
+from cryptography.fernet import Fernet
 from app.config import settings
 from app.models.prompt_config import PromptConfig
 from app.models.wrapped_api import WrappedAPI
-from app.services.document_extractor import extract_text_preview
+from app.services.document_extractor import extract_full_text
+from app.services.http_client import get_http_client
 from app.services.templates import (
     use_thinking,
     emit_thinking_content,
@@ -37,6 +43,51 @@ logger = logging.getLogger(__name__)
 # Initialize OpenAI client
 _openai_client = None
 
+# web_search tool definition offered to wrapped APIs (shared; LiteLLM does not mutate it)
+_WEB_SEARCH_TOOL_DEF = {
+    "type": "function",
+    "function": {
+        "name": "web_search",
+        "description": "Search the web and return a concise summary of top results with sources.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string"},
+                "max_results": {"type": "integer", "minimum": 1, "maximum": 10, "default": 5}
+            },
+            "required": ["query"]
+        }
+    }
+}
+
+# Provider errors meaning the temperature param is unsupported or must stay at its default
+# ("unsupported" also covers "unsupported_value")
+_TEMPERATURE_ERROR_RE = re.compile(
+    r"^(?=.*temperature)(?=.*(?:unsupported|only the default \(1\)))",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Simple in-memory cache for web search results: {(query, max_results): (expires_at_epoch, result_text)}
+_WEB_SEARCH_CACHE: Dict[Tuple[str, int], Tuple[float, str]] = {}
+_WEB_SEARCH_CACHE_TTL_SECONDS = 300
+_WEB_SEARCH_CACHE_MAX_ENTRIES = 2048
+
+# Assembled uploaded-document context per wrap: {wrapped_api_id: (expires_at_epoch, version, context)}
+_DOC_CONTEXT_CACHE: Dict[int, Tuple[float, tuple, str]] = {}
+_DOC_CONTEXT_CACHE_TTL_SECONDS = 60
+_DOC_CONTEXT_CACHE_MAX_ENTRIES = 512
+
+# Documents with a backfill in flight (or with no extractable text, so not worth retrying),
+# and the running backfill tasks (held so they are not garbage-collected mid-flight)
+_EXTRACTION_BACKFILL_SCHEDULED: set = set()
+_BACKGROUND_TASKS: set = set()
+
+# Fields copied from current_config into a confirmed config chat turn when the model omitted them
+# (CRITICAL: include instructions for Test Chat)
+_CONFIRMATION_FILL_FIELDS = (
+    "tone", "model", "rules", "purpose", "role", "instructions", "response_format", "temperature", "examples"
+)
+
 
 # ===== System Prompt Building Functions =====
 
@@ -596,6 +647,123 @@ Remember: Quality over speed. Get complete information before finalizing. Use th
 
 # ===== End System Prompt Building Functions =====
 
+def _extract_json_object(text: str) -> Optional[str]:
+    """
+    Return the first balanced {...} object in text, or None.
+    Linear scan with a depth counter (skipping braces inside JSON strings),
+    so malformed LLM output cannot trigger regex backtracking. If the scan
+    from one "{" never balances (e.g. a stray brace in leading prose), it
+    restarts from the next "{".
+    """
+    start = text.find("{")
+    while start >= 0:
+        depth = 0
+        in_string = False
+        escaped = False
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+        start = text.find("{", start + 1)
+    return None
+
+@lru_cache(maxsize=4)
+def _provider_cipher(encryption_key: bytes) -> Fernet:
+    # Keyed by the key bytes so a changed ENCRYPTION_KEY gets a new cipher
+    return Fernet(encryption_key)
+
+
+def _decrypt_provider_api_key(encrypted_key: str) -> str:
+    """
+    Decrypt an LLM provider API key using same cipher as llm_providers.
+    Only the cipher is cached; plaintext keys are never kept in memory.
+    """
+    _encryption_key = getattr(settings, 'encryption_key', None)
+    if not _encryption_key:
+        raise ValueError("ENCRYPTION_KEY not configured")
+    try:
+        if isinstance(_encryption_key, str):
+            cipher_suite = _provider_cipher(_encryption_key.encode())
+        else:
+            cipher_suite = _provider_cipher(_encryption_key)
+        return cipher_suite.decrypt(encrypted_key.encode()).decode()
+    except Exception as e:
+        logger.error(f"Decryption error: {e}")
+        logger.error("This usually means the LLM provider was encrypted with a different ENCRYPTION_KEY.")
+        logger.error("Solution: Delete and re-add your LLM providers after setting ENCRYPTION_KEY in .env")
+        raise ValueError("Failed to decrypt API key - LLM provider may have been encrypted with a different key. Please delete and re-add your LLM provider in the dashboard.")
+
+# Limited builtins exposed to custom tool code
+_TOOL_BUILTINS = {
+    "print": print,
+    "len": len,
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": bool,
+    "dict": dict,
+    "list": list,
+    "tuple": tuple,
+    "range": range,
+    "enumerate": enumerate,
+    "zip": zip,
+    "isinstance": isinstance,
+    "json": json,
+    "Exception": Exception,
+}
+
+# Base namespace for custom tool execution; copied per call (builtins included) so nothing a
+# tool defines or overwrites leaks between runs
+_TOOL_NAMESPACE_TEMPLATE = {
+    "__builtins__": _TOOL_BUILTINS,
+    "json": json,
+    "urllib": urllib,
+    "os": os,  # Allow os for env vars
+}
+
+@lru_cache(maxsize=128)
+def _compile_tool_code(tool_code: str):
+    """Compile custom tool source once; repeated tool calls reuse the code object."""
+    return compile(tool_code, "<custom_tool>", "exec")
+
+# Default model per provider when a wrap has no model set
+DEFAULT_MODELS = {
+    "openai": "gpt-4-turbo",  # Changed to GPT-4 for better function calling
+    "anthropic": "claude-3-haiku-20240307",
+    "deepseek": "deepseek-chat",
+    "groq": "llama-3.1-8b-instant",
+    "gemini": "gemini-pro",
+    "mistral": "mistral-tiny",
+    "cohere": "command",
+    "together_ai": "meta-llama/Llama-2-7b-chat-hf",
+    "perplexity": "llama-3.1-sonar-small-128k-online",
+    "anyscale": "meta-llama/Llama-2-7b-chat-hf",
+    "azure": "gpt-4-turbo",  # Changed to GPT-4
+    "openrouter": "openai/gpt-4-turbo",  # Changed to GPT-4
+}
+
+@lru_cache(maxsize=256)
+def _resolve_model_str(provider_name: str, model: Optional[str]) -> str:
+    """Resolve the LiteLLM model string for a provider/model pair"""
+    model = model or DEFAULT_MODELS.get(provider_name, "gpt-3.5-turbo")
+    # Format model string for LiteLLM
+    if "/" not in model and provider_name != "custom":
+        return f"{provider_name}/{model}"
+    return model
+
 def get_openai_client():
     """Get or create OpenAI client"""
     global _openai_client
@@ -640,6 +808,9 @@ async def parse_chat_command(
         return {"error": "OpenAI API not configured"}
     
     try:
+        # Hash the available models once so model checks below are O(1) lookups
+        available_model_set = frozenset(current_config.get("available_models") or ())
+
         # Extract test chat logs for analysis
         test_chat_logs = current_config.get("test_chat_logs", [])
         test_logs_context = ""
@@ -1053,9 +1224,8 @@ Ask ONE question at a time. When user confirms, return ALL fields.
         print(f"✅ [CONFIG CHAT] REASONING_COMPLETED event emitted")
         print(f"✅ [CONFIG CHAT] THINKING_COMPLETED event emitted")
         print(f"✅ [CONFIG CHAT] Total events at completion: {len(config_events)}")
-        print(f"✅ [CONFIG CHAT] All events: {config_events}")
         
-        # Check for empty response before attempting JSON parsing
+        # Check for empty response before attempting JSON parsing (result_text is already stripped)
         if not result_text:
             logger.error("[Config Chat] Second API call returned empty content")
             return {
@@ -1063,14 +1233,6 @@ Ask ONE question at a time. When user confirms, return ALL fields.
                 "response_message": "Sorry, I couldn't generate a response. Please try again."
             }
         
-        # Ensure result_text is not empty before parsing
-        if not result_text or not result_text.strip():
-            logger.error("[Config Chat] result_text is empty before JSON parsing")
-            return {
-                "error": "Config assistant returned an empty response.",
-                "response_message": "Sorry, I couldn't generate a response. Please try again."
-            }
-        
         logger.info(f"Raw OpenAI response: {result_text[:200]}")
 
         # Helper to strip code fences and parse JSON
@@ -1090,9 +1252,8 @@ Ask ONE question at a time. When user confirms, return ALL fields.
                 return json.loads(cleaned)
             except json.JSONDecodeError:
                 # Fallback: try to extract the first JSON object substring
-                json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', cleaned, re.DOTALL)
-                if json_match:
-                    candidate = json_match.group(0).strip()
+                candidate = _extract_json_object(cleaned)
+                if candidate:
                     try:
                         return json.loads(candidate)
                     except json.JSONDecodeError:
@@ -1178,20 +1339,16 @@ Ask ONE question at a time. When user confirms, return ALL fields.
                     "events": config_events
                 }
 
-                logger.info(f"[Config Chat] Added {len(pending_tools)} tools to response")
-
             # Add events to response for frontend (always include, even if empty)
-            parsed["events"] = config_events
-            parsed["wx_events"] = config_events  # legacy name for compatibility
+            # Both keys share the same list; wx_events is the legacy name for compatibility
+            parsed["wx_events"] = parsed["events"] = config_events
             if config_events:
                 logger.info(f"[Config Chat] Added {len(config_events)} events to response")
                 print(f"📤 [CONFIG CHAT] ========== SENDING EVENTS TO FRONTEND ==========")
                 print(f"📤 [CONFIG CHAT] Total events: {len(config_events)}")
                 print(f"📤 [CONFIG CHAT] Events list:")
                 for i, ev in enumerate(config_events, 1):
-                    print(f"📤 [CONFIG CHAT]   Event {i}: {ev.get('type')} - {ev}")
-                print(f"📤 [CONFIG CHAT] Events added to parsed['events']: {parsed.get('events')}")
-                print(f"📤 [CONFIG CHAT] Events added to parsed['wx_events']: {parsed.get('wx_events')}")
+                    print(f"📤 [CONFIG CHAT]   Event {i}: {ev.get('type')}")
             else:
                 print(f"⚠️ [CONFIG CHAT] WARNING: No events to send! config_events is empty")
 
@@ -1207,8 +1364,7 @@ Ask ONE question at a time. When user confirms, return ALL fields.
             required_fields = ["tone", "model"]
             def valid_model_field():
                 model_val = parsed.get("model")
-                avail = current_config.get("available_models", [])
-                return bool(model_val) and isinstance(model_val, str) and model_val in avail
+                return bool(model_val) and isinstance(model_val, str) and model_val in available_model_set
             def valid_examples_field():
                 examples_val = parsed.get("examples")
                 if examples_val is None:
@@ -1220,21 +1376,24 @@ Ask ONE question at a time. When user confirms, return ALL fields.
                 if not isinstance(examples_val, str):
                     examples_val = str(examples_val) if examples_val else ""
                 # Examples must have at least 2 Q/A pairs in proper format (matching system prompt's request for 2-3)
-                import re as _re
-                matches = _re.findall(r'\d+\. Q: .*?A: .*?(?=\d+\. Q: |$)', examples_val, _re.DOTALL)
+                matches = re.findall(r'\d+\. Q: .*?A: .*?(?=\d+\. Q: |$)', examples_val, re.DOTALL)
                 return isinstance(examples_val, str) and len(matches) >= 2
+            # Evaluate once: the checks below only fill fields that are still empty,
+            # so neither result can change for the rest of this turn
+            model_valid = valid_model_field()
+            examples_valid = valid_examples_field()
             # On first message, or while model/examples are invalid, just show response_message
             if (
                 "response_message" in parsed and
                 (
-                    not valid_model_field() or not valid_examples_field()
+                    not model_valid or not examples_valid
                 )
             ):
-                logger.info(f"[Config Chat] Returning greeting/step: response_message only (no config update). Model valid: {valid_model_field()}, Examples valid: {valid_examples_field()}. Parsed: {parsed}")
+                logger.info(f"[Config Chat] Returning greeting/step: response_message only (no config update). Model valid: {model_valid}, Examples valid: {examples_valid}. Parsed: {parsed}")
                 result_payload = {"response_message": parsed["response_message"]}
                 # Include both casings of pending tools
-                if parsed.get("pending_tools") or parsed.get("pendingTools"):
-                    tools = parsed.get("pending_tools") or parsed.get("pendingTools")
+                tools = parsed.get("pending_tools") or parsed.get("pendingTools")
+                if tools:
                     result_payload["pending_tools"] = tools
                     result_payload["pendingTools"] = tools
                 return result_payload
@@ -1248,10 +1407,13 @@ Ask ONE question at a time. When user confirms, return ALL fields.
             # If user confirmed and we have minimum fields, try to fill missing ones from current_config
             if is_confirmation:
                 logger.info(f"[Config Chat] User confirmed. Checking if we can finalize with current config...")
-                # Fill missing fields from current_config if not in parsed (CRITICAL: include instructions for Test Chat)
-                for field in ["tone", "model", "rules", "purpose", "role", "instructions", "response_format", "temperature", "examples"]:
-                    if not parsed.get(field) and current_config.get(field):
-                        parsed[field] = current_config[field]
+                # Fill missing fields from current_config if not in parsed
+                for field in _CONFIRMATION_FILL_FIELDS:
+                    if parsed.get(field):
+                        continue
+                    value = current_config.get(field)
+                    if value:
+                        parsed[field] = value
                         logger.info(f"[Config Chat] Filled missing {field} from current_config")
             
             # When config is complete, mark status as ready, else show full missing info
@@ -1265,8 +1427,8 @@ Ask ONE question at a time. When user confirms, return ALL fields.
             logger.info(f"🔍 [Config Chat] Required fields: {required_final_fields}")
             logger.info(f"🔍 [Config Chat] Parsed fields present: {[f for f in required_final_fields if parsed.get(f)]}")
             logger.info(f"🔍 [Config Chat] Missing fields: {missing_final}")
-            logger.info(f"🔍 [Config Chat] Model valid: {valid_model_field()}")
-            logger.info(f"🔍 [Config Chat] Examples valid: {valid_examples_field()}")
+            logger.info(f"🔍 [Config Chat] Model valid: {model_valid}")
+            logger.info(f"🔍 [Config Chat] Examples valid: {examples_valid}")
             logger.info(f"🔍 [Config Chat] Critical Test Chat fields check:")
             role_val = parsed.get('role')
             instructions_val = parsed.get('instructions')
@@ -1275,14 +1437,14 @@ Ask ONE question at a time. When user confirms, return ALL fields.
             logger.info(f"   - instructions: {'✅' if instructions_val else '❌ MISSING'} = {str(instructions_val)[:50] if instructions_val else 'NONE'}")
             logger.info(f"   - model: {'✅' if model_val else '❌ MISSING'} = {str(model_val) if model_val else 'NONE'}")
             
-            if valid_model_field() and valid_examples_field() and not missing_final:
+            if model_valid and examples_valid and not missing_final:
                 parsed["config_status"] = "ready"
                 logger.info(f"✅ [Config Chat] FINAL CONFIG: All required fields present. Will save/unlock with config")
                 logger.info(f"✅ [Config Chat] Config status set to 'ready'")
             else:
                 logger.warning(
                     f"❌ [Config Chat] FINALIZATION BLOCKED! Missing fields: {missing_final} | "
-                    f"Model valid: {valid_model_field()} | Examples valid: {valid_examples_field()}"
+                    f"Model valid: {model_valid} | Examples valid: {examples_valid}"
                 )
                 logger.warning(f"❌ [Config Chat] This means Test Chat will remain LOCKED!")
                 logger.warning(f"❌ [Config Chat] Parsed keys: {list(parsed.keys())}")
@@ -1379,6 +1541,108 @@ def build_system_prompt(prompt_config: Optional[PromptConfig]) -> str:
     return "\n".join(parts).strip()
 
 
+async def _backfill_extracted_text(document_id: int) -> None:
+    """Extract and persist full text for a document uploaded before extracted_text existed"""
+    from app.database import AsyncSessionLocal
+    from app.models.uploaded_document import UploadedDocument
+
+    try:
+        async with AsyncSessionLocal() as session:
+            doc = await session.get(UploadedDocument, document_id)
+            if not doc or doc.extracted_text:
+                _EXTRACTION_BACKFILL_SCHEDULED.discard(document_id)
+                return
+            # PDF/DOCX parsing is CPU-bound; keep it off the event loop
+            text = await asyncio.to_thread(
+                extract_full_text,
+                content_b64=doc.content,
+                file_type=doc.file_type,
+                mime_type=doc.mime_type,
+            )
+            if not text:
+                # Stays marked: extraction would fail the same way on every turn
+                logger.info(f"No text could be extracted from document {document_id}; leaving it unset")
+                return
+            doc.extracted_text = text
+            await session.commit()
+            logger.info(f"Backfilled extracted_text for document {document_id} ({len(text)} chars)")
+        # Persisted, so later turns no longer ask for a backfill
+        _EXTRACTION_BACKFILL_SCHEDULED.discard(document_id)
+    except Exception as e:
+        logger.warning(f"Failed to backfill extracted_text for document {document_id}: {e}")
+        # Unmark so a later turn retries (e.g. after a transient DB error)
+        _EXTRACTION_BACKFILL_SCHEDULED.discard(document_id)
+
+
+def _schedule_extracted_text_backfill(document_id: int) -> None:
+    if document_id in _EXTRACTION_BACKFILL_SCHEDULED:
+        return
+    _EXTRACTION_BACKFILL_SCHEDULED.add(document_id)
+    task = asyncio.create_task(_backfill_extracted_text(document_id))
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+
+
+async def _get_document_context(db, wrapped_api_id: int) -> str:
+    """
+    Build the uploaded-documents section of a wrap's system prompt.
+    Cached per wrap and invalidated by a cheap version query
+    (document count, newest id, count with extracted text), so unchanged
+    documents are not re-fetched or re-assembled on every chat turn.
+    """
+    from sqlalchemy import select, func
+    from app.models.uploaded_document import UploadedDocument
+
+    version_result = await db.execute(
+        select(
+            func.count(UploadedDocument.id),
+            func.max(UploadedDocument.id),
+            func.count(UploadedDocument.extracted_text),
+        ).where(UploadedDocument.wrapped_api_id == wrapped_api_id)
+    )
+    version = tuple(version_result.one())
+    if not version[0]:
+        return ""
+
+    now = time.time()
+    cached = _DOC_CONTEXT_CACHE.get(wrapped_api_id)
+    if cached and cached[0] > now and cached[1] == version:
+        return cached[2]
+
+    # Only the columns the prompt needs: the base64 content column can be megabytes per row
+    docs_result = await db.execute(
+        select(UploadedDocument.id, UploadedDocument.filename, UploadedDocument.extracted_text)
+        .where(UploadedDocument.wrapped_api_id == wrapped_api_id)
+        .order_by(UploadedDocument.created_at.desc())
+    )
+    documents = docs_result.all()
+    if not documents:
+        return ""
+
+    # Collect fragments and join once; extracted_text can be large
+    doc_parts = ["\n\n=== UPLOADED DOCUMENTS ===\n"]
+    for doc in documents:
+        doc_name = doc.filename or "Untitled Document"
+        if doc.extracted_text:
+            # Use full extracted text
+            doc_parts.append(f"\n--- {doc_name} ---\n")
+            doc_parts.append(doc.extracted_text)
+            doc_parts.append("\n")
+        else:
+            # Legacy document without extracted_text: extract once in the background and persist,
+            # instead of decoding/parsing it on every chat turn. The backfill bumps the cache
+            # version, so the next turn picks up the full text.
+            logger.info(f"Document {doc.id} has no extracted_text; skipping this turn and backfilling")
+            _schedule_extracted_text_backfill(doc.id)
+    doc_parts.append("\n=== END OF DOCUMENTS ===\n")
+    doc_context = "".join(doc_parts)
+
+    if wrapped_api_id not in _DOC_CONTEXT_CACHE and len(_DOC_CONTEXT_CACHE) >= _DOC_CONTEXT_CACHE_MAX_ENTRIES:
+        _DOC_CONTEXT_CACHE.pop(next(iter(_DOC_CONTEXT_CACHE)), None)
+    _DOC_CONTEXT_CACHE[wrapped_api_id] = (now + _DOC_CONTEXT_CACHE_TTL_SECONDS, version, doc_context)
+    return doc_context
+
+
 async def call_wrapped_llm(
     wrapped_api: WrappedAPI,
     messages: list,
@@ -1391,29 +1655,8 @@ async def call_wrapped_llm(
     """
     import litellm
     from app.models.llm_provider import LLMProvider
-    from sqlalchemy.orm import selectinload
     from sqlalchemy import select
     from app.database import AsyncSessionLocal
-    from cryptography.fernet import Fernet
-    from app.config import settings
-    
-    # Encryption helper - use same logic as llm_providers router
-    def decrypt_api_key(encrypted_key: str) -> str:
-        """Decrypt API key using same cipher as llm_providers"""
-        _encryption_key = getattr(settings, 'encryption_key', None)
-        if not _encryption_key:
-            raise ValueError("ENCRYPTION_KEY not configured")
-        try:
-            if isinstance(_encryption_key, str):
-                cipher_suite = Fernet(_encryption_key.encode())
-            else:
-                cipher_suite = Fernet(_encryption_key)
-            return cipher_suite.decrypt(encrypted_key.encode()).decode()
-        except Exception as e:
-            logger.error(f"Decryption error: {e}")
-            logger.error("This usually means the LLM provider was encrypted with a different ENCRYPTION_KEY.")
-            logger.error("Solution: Delete and re-add your LLM providers after setting ENCRYPTION_KEY in .env")
-            raise ValueError("Failed to decrypt API key - LLM provider may have been encrypted with a different key. Please delete and re-add your LLM provider in the dashboard.")
     
     # Use provided session or create new one
     if db_session:
@@ -1425,66 +1668,45 @@ async def call_wrapped_llm(
     
     try:
         wx_events: List[Dict[str, Any]] = []
-        # Get provider
+        # Snapshot wrap-level thinking/web search settings once; everything below reads these locals
+        thinking_enabled = getattr(wrapped_api, "thinking_enabled", False)
+        thinking_mode = getattr(wrapped_api, "thinking_mode", None)
+        thinking_focus = getattr(wrapped_api, "thinking_focus", None)
+        web_search_mode = getattr(wrapped_api, "web_search", None)
+        web_search_triggers = getattr(wrapped_api, "web_search_triggers", None)
+        web_search_enabled_toggle = getattr(wrapped_api, "web_search_enabled", False)
+
+        # Get provider (project is not needed here, so skip the extra selectinload round trip)
         provider_result = await db.execute(
-            select(LLMProvider)
-            .where(LLMProvider.id == wrapped_api.provider_id)
-            .options(selectinload(LLMProvider.project))
+            select(LLMProvider).where(LLMProvider.id == wrapped_api.provider_id)
         )
         provider = provider_result.scalar_one_or_none()
         
         if not provider:
             raise ValueError("LLM Provider not found")
         
-        # Decrypt API key
-        api_key = decrypt_api_key(provider.api_key)
+        # Decrypt API key (cached per ciphertext)
+        api_key = _decrypt_provider_api_key(provider.api_key)
         
         # Build system prompt
         system_prompt = build_system_prompt(wrapped_api.prompt_config)
 
         # Inject uploaded documents into system prompt
         try:
-            from app.models.uploaded_document import UploadedDocument
-            docs_result = await db.execute(
-                select(UploadedDocument)
-                .where(UploadedDocument.wrapped_api_id == wrapped_api.id)
-                .order_by(UploadedDocument.created_at.desc())
-            )
-            documents = docs_result.scalars().all()
-            if documents:
-                doc_context = "\n\n=== UPLOADED DOCUMENTS ===\n"
-                for doc in documents:
-                    doc_name = doc.filename or "Untitled Document"
-                    if doc.extracted_text:
-                        # Use full extracted text
-                        doc_context += f"\n--- {doc_name} ---\n{doc.extracted_text}\n"
-                    else:
-                        # Fallback to preview
-                        preview = extract_text_preview(
-                            content_b64=doc.content,
-                            file_type=doc.file_type,
-                            mime_type=doc.mime_type,
-                            max_chars=1000
-                        )
-                        if preview:
-                            doc_context += f"\n--- {doc_name} (preview) ---\n{preview}\n"
-                doc_context += "\n=== END OF DOCUMENTS ===\n"
+            doc_context = await _get_document_context(db, wrapped_api.id)
+            if doc_context:
                 system_prompt = (system_prompt + doc_context).strip()
         except Exception as doc_err:
             logger.warning(f"Failed to inject documents into system prompt: {doc_err}")
 
         # Append thinking/web search configuration for clearer behavior
         try:
-            tm = getattr(wrapped_api, 'thinking_mode', None)
-            tf = getattr(wrapped_api, 'thinking_focus', None)
-            ws = getattr(wrapped_api, 'web_search', None)
-            wst = getattr(wrapped_api, 'web_search_triggers', None)
             config_lines = []
-            if tm and tm != 'off':
-                config_lines.append(f"Thinking: {tm}{' — Focus: ' + tf if tf else ''}")
-            if (ws and ws != 'off') or getattr(wrapped_api, 'web_search_enabled', False):
-                trig = f" — Triggers: {wst}" if wst else ''
-                config_lines.append(f"Web Search: {ws or ('enabled' if getattr(wrapped_api, 'web_search_enabled', False) else 'off')}{trig}")
+            if thinking_mode and thinking_mode != 'off':
+                config_lines.append(f"Thinking: {thinking_mode}{' — Focus: ' + thinking_focus if thinking_focus else ''}")
+            if (web_search_mode and web_search_mode != 'off') or web_search_enabled_toggle:
+                trig = f" — Triggers: {web_search_triggers}" if web_search_triggers else ''
+                config_lines.append(f"Web Search: {web_search_mode or ('enabled' if web_search_enabled_toggle else 'off')}{trig}")
             if config_lines:
                 system_prompt = (system_prompt + "\n\n" + "\n".join(config_lines)).strip()
         except Exception:
@@ -1496,28 +1718,7 @@ async def call_wrapped_llm(
             formatted_messages.append({"role": "system", "content": system_prompt})
         
         # Get model first (needed for DeepSeek preprocessing)
-        default_models = {
-            "openai": "gpt-4-turbo",  # Changed to GPT-4 for better function calling
-            "anthropic": "claude-3-haiku-20240307",
-            "deepseek": "deepseek-chat",
-            "groq": "llama-3.1-8b-instant",
-            "gemini": "gemini-pro",
-            "mistral": "mistral-tiny",
-            "cohere": "command",
-            "together_ai": "meta-llama/Llama-2-7b-chat-hf",
-            "perplexity": "llama-3.1-sonar-small-128k-online",
-            "anyscale": "meta-llama/Llama-2-7b-chat-hf",
-            "azure": "gpt-4-turbo",  # Changed to GPT-4
-            "openrouter": "openai/gpt-4-turbo",  # Changed to GPT-4
-        }
-        default_model = default_models.get(provider.provider_name, "gpt-3.5-turbo")
-        model = wrapped_api.model or default_model
-        
-        # Format model string for LiteLLM
-        if "/" not in model and provider.provider_name != "custom":
-            model_str = f"{provider.provider_name}/{model}"
-        else:
-            model_str = model
+        model_str = _resolve_model_str(provider.provider_name, wrapped_api.model)
         
         # Preprocess messages for DeepSeek reasoner models
         # DeepSeek reasoner requires reasoning_content instead of content when tool_calls are present
@@ -1561,40 +1762,21 @@ async def call_wrapped_llm(
         if provider.api_base_url:
             params["api_base"] = provider.api_base_url
 
-        # Load custom tools from database - tool integration system removed
+        # Custom tools - tool integration system removed
+        # Tool integration models (WrapTool, WrapCredential) have been removed, so there is
+        # nothing to load (or overlap with the first LLM call, which needs the tool list up front)
         custom_tools_data = {}  # Store tool code and credentials
-        async def load_custom_tools() -> List[dict]:
-            """Load custom tools - tool integration system removed"""
-            # Tool integration models (WrapTool, WrapCredential) have been removed
-            # Return empty list - custom tools are no longer supported
-            return []
+        custom_tool_defs: List[dict] = []
 
         # Define built-in tools
         builtin_tools = []
 
         # Add web_search if enabled
-        web_search_mode = getattr(wrapped_api, "web_search", None)
-        web_search_enabled_toggle = getattr(wrapped_api, "web_search_enabled", False)
         web_search_active = (web_search_mode is not None and web_search_mode != "off") or web_search_enabled_toggle
         if web_search_active:
-            builtin_tools.append({
-                "type": "function",
-                "function": {
-                    "name": "web_search",
-                    "description": "Search the web and return a concise summary of top results with sources.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "query": {"type": "string"},
-                            "max_results": {"type": "integer", "minimum": 1, "maximum": 10, "default": 5}
-                        },
-                        "required": ["query"]
-                    }
-                }
-            })
+            builtin_tools.append(_WEB_SEARCH_TOOL_DEF)
 
-        # Load and combine custom tools
-        custom_tool_defs = await load_custom_tools()
+        # Combine built-in and custom tools
         all_tools = builtin_tools + custom_tool_defs
 
         # Set tools parameter
@@ -1621,32 +1803,11 @@ async def call_wrapped_llm(
             import asyncio
 
             try:
-                # Create execution namespace with limited builtins
-                namespace = {
-                    "__builtins__": {
-                        "print": print,
-                        "len": len,
-                        "str": str,
-                        "int": int,
-                        "float": float,
-                        "bool": bool,
-                        "dict": dict,
-                        "list": list,
-                        "tuple": tuple,
-                        "range": range,
-                        "enumerate": enumerate,
-                        "zip": zip,
-                        "isinstance": isinstance,
-                        "json": json,
-                        "Exception": Exception,
-                    },
-                    "json": json,
-                    "urllib": urllib,
-                    "os": os,  # Allow os for env vars
-                }
+                # Create execution namespace with limited builtins (fresh copy per call)
+                namespace = {**_TOOL_NAMESPACE_TEMPLATE, "__builtins__": dict(_TOOL_BUILTINS)}
 
-                # Execute the tool code to define execute_tool function
-                exec(tool_code, namespace)
+                # Execute the (cached) compiled tool code to define execute_tool function
+                exec(_compile_tool_code(tool_code), namespace)
 
                 # Check if execute_tool function exists
                 if "execute_tool" not in namespace:
@@ -1673,7 +1834,7 @@ async def call_wrapped_llm(
                 raise ValueError(f"Tool execution failed: {str(e)}")
 
         # Helper to execute web search using Google Custom Search API
-        def execute_web_search(query: str, max_results: int = 5) -> str:
+        async def execute_web_search(query: str, max_results: int = 5) -> str:
             google_cse_key = settings.google_cse_api_key
             google_cse_id = settings.google_cse_id
 
@@ -1689,21 +1850,32 @@ async def call_wrapped_llm(
                 logger.error(f"❌ {error_msg}")
                 return error_msg
 
+            cache_key = (query, max_results)
+            now = time.time()
+            cached = _WEB_SEARCH_CACHE.get(cache_key)
+            if cached and cached[0] > now:
+                logger.info(f"  ✅ Returning cached web search results")
+                return cached[1]
+
             try:
                 logger.info(f"🔍 Using Google Custom Search API")
                 
-                url = f"https://www.googleapis.com/customsearch/v1?key={google_cse_key}&cx={google_cse_id}&q={urllib.parse.quote(query)}&num={min(max_results, 10)}"
-                logger.info(f"  URL: {url}")
-
-                req = urllib.request.Request(
-                    url=url,
+                logger.info(f"  Sending request...")
+                # Shared pooled client keeps connections to the CSE API alive across searches
+                resp = await get_http_client().get(
+                    "https://www.googleapis.com/customsearch/v1",
+                    params={
+                        "key": google_cse_key,
+                        "cx": google_cse_id,
+                        "q": query,
+                        "num": min(max_results, 10),
+                    },
                     headers={"User-Agent": "Wrap-X/1.0"},
-                    method="GET",
+                    timeout=15.0,
                 )
-
-                logger.info(f"  Sending request...")
-                with urllib.request.urlopen(req, timeout=15) as resp:
-                    data = json.loads(resp.read().decode("utf-8"))
+                resp.raise_for_status()
+                # Parse straight from the response bytes (no intermediate str decode)
+                data = json.loads(resp.content)
 
                 logger.info(f"  ✅ Google CSE response received")
                 logger.info(f"  Response keys: {list(data.keys())}")
@@ -1718,14 +1890,17 @@ async def call_wrapped_llm(
 
                 result_text = "Search results:\n" + "\n".join(lines) if lines else "No results found."
                 logger.info(f"✅ Google CSE search completed: {len(lines)} results")
+                # Cache successful lookups only; evict the oldest entry when full
+                if len(_WEB_SEARCH_CACHE) >= _WEB_SEARCH_CACHE_MAX_ENTRIES:
+                    _WEB_SEARCH_CACHE.pop(next(iter(_WEB_SEARCH_CACHE)), None)
+                _WEB_SEARCH_CACHE[cache_key] = (now + _WEB_SEARCH_CACHE_TTL_SECONDS, result_text)
                 return result_text
 
-            except (HTTPError, URLError, TimeoutError) as e:
+            except httpx.HTTPError as e:
+                response = getattr(e, "response", None)
                 logger.error(f"❌ Web search HTTP/URL error: {e}")
                 logger.error(f"   Error type: {type(e).__name__}")
-                logger.error(f"   HTTP Code: {getattr(e, 'code', 'N/A')}")
-                logger.error(f"   Reason: {getattr(e, 'reason', 'N/A')}")
-                logger.error(f"   URL: {getattr(e, 'url', 'N/A')}")
+                logger.error(f"   HTTP Code: {response.status_code if response is not None else 'N/A'}")
                 logger.error(f"   Stack trace:", exc_info=True)
                 return f"Web search failed: {type(e).__name__} - {e}"
             except Exception as e:
@@ -1738,12 +1913,9 @@ async def call_wrapped_llm(
         
         # If thinking is enabled, note start
         # Check both the new boolean toggle and legacy thinking_mode string
-        thinking_enabled = getattr(wrapped_api, "thinking_enabled", False)
-        thinking_mode = getattr(wrapped_api, "thinking_mode", None)
-        thinking_focus = getattr(wrapped_api, "thinking_focus", None)
-        
         # Enable thinking if either the boolean toggle is on OR the legacy mode is not "off"
-        if thinking_enabled or (thinking_mode and thinking_mode != "off"):
+        thinking_started = bool(thinking_enabled or (thinking_mode and thinking_mode != "off"))
+        if thinking_started:
             thinking_event = {"type": "thinking_started"}
             if thinking_focus:
                 thinking_event["focus"] = thinking_focus
@@ -1754,26 +1926,17 @@ async def call_wrapped_llm(
             try:
                 return await litellm.acompletion(**p)
             except Exception as e:
-                msg = str(e)
                 # Some providers/models only accept default temperature=1 or disallow the param entirely
-                temp_err = (
-                    "temperature" in msg and (
-                        "unsupported" in msg.lower() or
-                        "unsupported_value" in msg.lower() or
-                        "only the default (1)" in msg.lower()
-                    )
-                )
-                if temp_err:
-                    # Retry without temperature
-                    p2 = dict(p)
-                    p2.pop("temperature", None)
+                if _TEMPERATURE_ERROR_RE.search(str(e)):
+                    # Retry without temperature. p is this request's params dict, so adjusting it
+                    # in place also keeps the second (tool-result) pass from repeating the failure.
+                    p.pop("temperature", None)
                     try:
-                        return await litellm.acompletion(**p2)
+                        return await litellm.acompletion(**p)
                     except Exception:
                         # Last attempt with explicit default = 1
-                        p3 = dict(p2)
-                        p3["temperature"] = 1
-                        return await litellm.acompletion(**p3)
+                        p["temperature"] = 1
+                        return await litellm.acompletion(**p)
                 raise
 
         # Call LiteLLM (first pass)
@@ -1849,7 +2012,8 @@ async def call_wrapped_llm(
                 logger.info(f"  Arguments: {args_str}")
 
                 try:
-                    args = json.loads(args_str) if isinstance(args_str, str) else args_str
+                    # json.loads takes str or raw bytes directly; already-decoded dicts pass through
+                    args = json.loads(args_str) if isinstance(args_str, (str, bytes, bytearray)) else args_str
                 except Exception as e:
                     logger.error(f"  ❌ Failed to parse arguments: {e}")
                     args = {"query": str(args_str)}
@@ -1865,14 +2029,14 @@ async def call_wrapped_llm(
                     query = args.get("query", "")
                     max_results = int(args.get("max_results", 5))
                     logger.info(f"  Executing web search: '{query}' (max {max_results} results)")
-                    result_text = execute_web_search(query, max_results)
+                    result_text = await execute_web_search(query, max_results)
                     logger.info(f"  Web search completed. Result length: {len(result_text)}")
                     # Add search result summary to event
                     wx_events.append({
                         "type": "tool_result",
                         "name": name or "tool",
                         "query": query,
-                        "results_count": len(result_text.split("\n")) if result_text else 0
+                        "results_count": (result_text.count("\n") + 1) if result_text else 0
                     })
                 elif name in custom_tools_data:
                     # Execute custom tool
@@ -1914,14 +2078,14 @@ async def call_wrapped_llm(
             assistant_msg = to_message(first_choice)
 
         # Thinking complete
-        if any(ev.get("type") == "thinking_started" for ev in wx_events):
+        if thinking_started:
             wx_events.append({"type": "thinking_completed"})
         
         # Format response in OpenAI-compatible format
         return {
-            "id": f"chatcmpl-{wrapped_api.id}-{hash(str(messages))}",
+            "id": f"chatcmpl-{wrapped_api.id}-{uuid.uuid4().hex[:16]}",
             "object": "chat.completion",
-            "created": int(__import__("time").time()),
+            "created": int(time.time()),
             "model": model_str,
             "choices": [
                 {
@@ -2,11 +2,12 @@
 Config validation service for config chat endpoint.
 Provides strict parsing, field whitelisting, range validation, and model allowlist checking.
 """
-from typing import Dict, Any, List, Optional
+from functools import lru_cache
+from typing import Callable, Dict, Any, FrozenSet, List, Optional, Tuple
 import logging
 import re
 from app.models.llm_provider import LLMProvider
-from app.services.model_catalog import get_available_models
+from app.services.model_catalog import get_cached_models, get_fallback_models
 
 # Initialize logger first
 logger = logging.getLogger(__name__)
@@ -21,7 +22,7 @@ except ImportError:
 
 
 # Allowed fields for config updates
-ALLOWED_FIELDS = {
+ALLOWED_FIELDS = frozenset({
     "role",
     "instructions",
     "rules",
@@ -55,18 +56,47 @@ ALLOWED_FIELDS = {
     "tool_integration_data",  # tool integration discovery data for UI
     "toolIntegrationData",  # camelCase variant for compatibility
     "action_selection_data",  # action selection data for UI
-    "events",  # frontend events
-    "wx_events",  # legacy events name
-    "tool_integration_data",  # tool discovery/generation data for UI
-    "toolIntegrationData",  # camelCase variant for tool integration data
     "events",  # UI events (thinking, reasoning, etc.)
-    "wx_events",  # wrapped API events
-}
+    "wx_events",  # legacy events name
+})
 
 # Enum validations
-VALID_TONES = {"Casual", "Professional", "Friendly", "Direct", "Technical", "Supportive"}
-VALID_THINKING_MODES = {"always", "conditional", "off", "brief", "detailed"}
-VALID_WEB_SEARCH_MODES = {"always", "conditional", "off", "never", "only_if_asked", "when_unsure_or_latest", "often"}
+VALID_TONES = frozenset({"Casual", "Professional", "Friendly", "Direct", "Technical", "Supportive"})
+# Lowercase tone -> canonical tone
+_LOWER_TO_TONE = {tone.lower(): tone for tone in VALID_TONES}
+# Tone separators (+, /, |, &) all collapse to a comma
+_TONE_SEP_TABLE = str.maketrans({"+": ",", "/": ",", "|": ",", "&": ","})
+VALID_THINKING_MODES = frozenset({"always", "conditional", "off", "brief", "detailed"})
+VALID_WEB_SEARCH_MODES = frozenset({"always", "conditional", "off", "never", "only_if_asked", "when_unsure_or_latest", "often"})
+
+# Accepted enum labels -> internal value stored in config
+_THINKING_MODE_NORMALIZE = {
+    "always": "always",
+    "conditional": "conditional",
+    "off": "off",
+    "brief": "conditional",
+    "detailed": "always",
+}
+_WEB_SEARCH_NORMALIZE = {
+    "always": "always",
+    "conditional": "conditional",
+    "off": "off",
+    "never": "off",
+    "only_if_asked": "conditional",
+    "when_unsure_or_latest": "conditional",
+    "often": "always",
+}
+
+# Sorted values and error messages for the enum fields, built once
+_SORTED_TONES = tuple(sorted(VALID_TONES))
+_SORTED_THINKING_MODES = tuple(sorted(VALID_THINKING_MODES))
+_SORTED_WEB_SEARCH_MODES = tuple(sorted(VALID_WEB_SEARCH_MODES))
+_TONE_ERROR_MESSAGE = (
+    "Tone must be one of: " + ", ".join(_SORTED_TONES) +
+    "; optionally combine up to two (e.g., 'Friendly + Direct')."
+)
+_THINKING_MODE_ERROR_MESSAGE = f"Thinking mode must be one of: {', '.join(_SORTED_THINKING_MODES)}"
+_WEB_SEARCH_ERROR_MESSAGE = f"Web search mode must be one of: {', '.join(_SORTED_WEB_SEARCH_MODES)}"
 
 # Range validations
 FIELD_RANGES = {
@@ -76,6 +106,70 @@ FIELD_RANGES = {
     "frequency_penalty": {"min": -2.0, "max": 2.0},
 }
 
+# Precompiled patterns for examples normalization/validation
+_NUM_PREFIX_RE = re.compile(r"^\d+\.")
+_NUM_PREFIX_STRIP_RE = re.compile(r"^\d+\.\s*")
+# A line starting with "N." after optional indentation
+_NUMBERED_LINE_RE = re.compile(r"^[^\S\n]*\d+\.", re.MULTILINE)
+
+# PII / secret patterns redacted from chat logs (compiled once per process)
+_API_KEY_RE = re.compile(r'(api[_-]?key|bearer|token|secret|password|auth)[\s:=]+["\']?[a-zA-Z0-9_\-]{20,}["\']?', re.IGNORECASE)
+_EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b')
+_PHONE_RE = re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b')
+_SSN_RE = re.compile(r'\b\d{3}-\d{2}-\d{4}\b')
+# Every pattern above needs one of these (keyword, "@" or a run of three digits) to match at all
+_REDACTION_HINT_RE = re.compile(r'api|bearer|token|secret|password|auth|@|\d{3}', re.IGNORECASE)
+# Characters scanned past the truncation point before redacting a long message
+_REDACTION_WINDOW_MARGIN = 256
+_WHITESPACE_RE = re.compile(r"\s")
+_NEXT_TOKEN_RE = re.compile(r"\s+\S*")
+_API_KEY_LABEL_TAIL_RE = re.compile(r'(api[_-]?key|bearer|token|secret|password|auth)[\s:=]*$', re.IGNORECASE)
+
+
+def _redact_pii(text: str) -> str:
+    # Applied in sequence on purpose: redacting a key can expose a word boundary that lets
+    # an adjacent phone/SSN match, which a single combined alternation would miss
+    if not _REDACTION_HINT_RE.search(text):
+        return text
+    text = _API_KEY_RE.sub("[REDACTED]", text)
+    # Replacements never introduce "@" or "-", so a missing literal rules a pass out
+    if "@" in text:
+        text = _EMAIL_RE.sub("[EMAIL]", text)
+    text = _PHONE_RE.sub("[PHONE]", text)
+    if "-" in text:
+        text = _SSN_RE.sub("[SSN]", text)
+    return text
+
+
+def _redaction_cut(text: str, start: int) -> Optional[int]:
+    """First whitespace index at/after start that splits no redaction match, or None."""
+    while True:
+        ws = _WHITESPACE_RE.search(text, start)
+        if not ws:
+            return None
+        end = ws.start()
+        # Patterns never span whitespace except an API-key label and its value
+        if not _API_KEY_LABEL_TAIL_RE.search(text, max(0, end - _REDACTION_WINDOW_MARGIN), end):
+            return end
+        start = _NEXT_TOKEN_RE.match(text, end).end()
+
+
+def _redact_and_truncate(text: str, max_length: int) -> str:
+    """Redact PII, then truncate to max_length (+ "..."), scanning only a bounded prefix."""
+    redacted = None
+    if len(text) > max_length + _REDACTION_WINDOW_MARGIN:
+        cut = _redaction_cut(text, max_length + _REDACTION_WINDOW_MARGIN)
+        if cut is not None:
+            # Redacting up to a safe cut yields a prefix of the fully redacted text
+            redacted = _redact_pii(text[:cut])
+            if len(redacted) <= max_length:
+                redacted = None
+    if redacted is None:
+        redacted = _redact_pii(text)
+    if len(redacted) > max_length:
+        redacted = redacted[:max_length] + "..."
+    return redacted
+
 
 class ValidationError(Exception):
     """Raised when config validation fails"""
@@ -88,28 +182,33 @@ def _normalize_examples_text(text: str) -> str:
     """
     Attempt to normalize examples into numbered `1. Q: ... A: ...` format.
     """
-    if not text:
+    # Only blocks containing both "Q:" and "A:" survive, so skip free-form text
+    if not text or "Q:" not in text or "A:" not in text:
         return text
     
-    lines = [line.strip() for line in text.splitlines()]
     candidates: List[str] = []
     current_block: List[str] = []
+    # Bound methods hoisted out of the per-line loop; current_block is reused via clear()
+    add_candidate = candidates.append
+    add_line = current_block.append
     
-    for line in lines:
+    # Lines are stripped and non-empty, so joined blocks need no further strip
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
         if not line:
             if current_block:
-                candidates.append(" ".join(current_block).strip())
-                current_block = []
+                add_candidate(" ".join(current_block))
+                current_block.clear()
             continue
         
-        if re.match(r"^\d+\.", line) or line.upper().startswith("Q:"):
+        if _NUM_PREFIX_RE.match(line) or line.upper().startswith("Q:"):
             if current_block:
-                candidates.append(" ".join(current_block).strip())
-                current_block = []
-        current_block.append(line)
+                add_candidate(" ".join(current_block))
+                current_block.clear()
+        add_line(line)
     
     if current_block:
-        candidates.append(" ".join(current_block).strip())
+        add_candidate(" ".join(current_block))
     
     qa_blocks = [block for block in candidates if "Q:" in block and "A:" in block]
     if not qa_blocks:
@@ -117,17 +216,265 @@ def _normalize_examples_text(text: str) -> str:
     
     normalized_lines: List[str] = []
     for idx, block in enumerate(qa_blocks, start=1):
-        block = re.sub(r"^\d+\.\s*", "", block).strip()
+        block = _NUM_PREFIX_STRIP_RE.sub("", block, count=1)
         if not block.upper().startswith("Q:"):
             block = f"Q: {block}"
         if "A:" not in block:
             # Skip entries without answers
             continue
-        normalized_lines.append(f"{idx}. {block.strip()}")
+        normalized_lines.append(f"{idx}. {block}")
     
     return "\n".join(normalized_lines) if normalized_lines else text
 
 
+def _normalize_tone_string(raw: str) -> str:
+    """Accept a single tone or up to two tones combined (e.g., "Friendly + Direct", "Friendly, Direct")"""
+    # Replace common separators with comma, then split
+    # Normalize separators: +, /, |, &, ' and '
+    s = str(raw).translate(_TONE_SEP_TABLE).replace(" and ", ",")
+    # Split, strip, lowercase tokens
+    parts = [p.strip() for p in s.split(",") if p.strip()]
+    tokens = []
+    for p in parts:
+        t = p.lower().strip()
+        if not t:
+            continue
+        # Map to canonical case; unknown tones map to None
+        canon = _LOWER_TO_TONE.get(t)
+        if canon and canon not in tokens:
+            tokens.append(canon)
+        # Cap at two tones
+        if len(tokens) >= 2:
+            break
+    return ", ".join(tokens)
+
+
+# ----- Per-field validators -----
+# Each validator receives (field, value, cleaned, errors, available_models, provider),
+# writes the accepted value into `cleaned` or appends error details to `errors`.
+
+def _validate_tone(field, value, cleaned, errors, available_models, provider) -> None:
+    normalized = _normalize_tone_string(value)
+    if not normalized:
+        errors.append({
+            "field": field,
+            "value": value,
+            "message": _TONE_ERROR_MESSAGE,
+            "valid_values": list(_SORTED_TONES)
+        })
+    else:
+        cleaned[field] = normalized
+
+
+def _validate_thinking_mode(field, value, cleaned, errors, available_models, provider) -> None:
+    # Normalize brief/detailed to internal values
+    normalized = _THINKING_MODE_NORMALIZE.get(value)
+    if normalized is None:
+        errors.append({
+            "field": field,
+            "value": value,
+            "message": _THINKING_MODE_ERROR_MESSAGE,
+            "valid_values": list(_SORTED_THINKING_MODES)
+        })
+    else:
+        cleaned[field] = normalized
+
+
+def _validate_web_search(field, value, cleaned, errors, available_models, provider) -> None:
+    # Normalize external labels to internal values
+    normalized = _WEB_SEARCH_NORMALIZE.get(value)
+    if normalized is None:
+        errors.append({
+            "field": field,
+            "value": value,
+            "message": _WEB_SEARCH_ERROR_MESSAGE,
+            "valid_values": list(_SORTED_WEB_SEARCH_MODES)
+        })
+    else:
+        cleaned[field] = normalized
+
+
+def _validate_range(field, value, cleaned, errors, available_models, provider) -> None:
+    try:
+        num_value = float(value) if field != "max_tokens" else int(value)
+        range_def = FIELD_RANGES[field]
+
+        if num_value < range_def["min"] or num_value > range_def["max"]:
+            errors.append({
+                "field": field,
+                "value": value,
+                "message": f"{field.capitalize()} must be between {range_def['min']} and {range_def['max']}",
+                "valid_range": range_def
+            })
+        else:
+            cleaned[field] = num_value
+    except (ValueError, TypeError):
+        errors.append({
+            "field": field,
+            "value": value,
+            "message": f"{field.capitalize()} must be a number",
+            "valid_range": FIELD_RANGES[field]
+        })
+
+
+def _validate_model(field, value, cleaned, errors, available_models, provider) -> None:
+    model_errors = validate_model_name(value, available_models, provider)
+    if model_errors:
+        errors.extend(model_errors)
+    else:
+        cleaned[field] = value
+
+
+# Disallowed snippets in pending tool code, with the error reported for each
+_DANGEROUS_CODE_PATTERNS = (
+    ("eval(", "eval() usage is not allowed for security"),
+    ("exec(", "exec() usage is not allowed for security"),
+    ("__import__", "dynamic imports not allowed for security"),
+)
+_DANGEROUS_CODE_RE = re.compile("|".join(re.escape(p) for p, _ in _DANGEROUS_CODE_PATTERNS))
+
+
+def _validate_pending_tools(field, value, cleaned, errors, available_models, provider) -> None:
+    # Validate structure of each pending tool
+    errors_before = len(errors)
+    validated_tools = []
+    for idx, tool in enumerate(value):
+        if not isinstance(tool, dict):
+            errors.append({
+                "field": f"pending_tools[{idx}]",
+                "value": tool,
+                "message": "Each tool must be a dictionary",
+                "valid_type": "dict"
+            })
+            continue
+
+        # Required: tool_name or name
+        tool_name = tool.get("tool_name") or tool.get("name")
+        if not tool_name:
+            errors.append({
+                "field": f"pending_tools[{idx}]",
+                "value": tool,
+                "message": "Tool must have 'tool_name' or 'name' field",
+                "required_fields": ["tool_name", "name"]
+            })
+            continue
+
+        # Required: credential_fields must be a list if present
+        cred_fields = tool.get("credential_fields") or tool.get("fields") or []
+        if not isinstance(cred_fields, list):
+            errors.append({
+                "field": f"pending_tools[{idx}].credential_fields",
+                "value": cred_fields,
+                "message": "credential_fields must be a list",
+                "valid_type": "list"
+            })
+            continue
+
+        # OAuth validation
+        if tool.get("requires_oauth"):
+            oauth_provider = tool.get("oauth_provider")
+            oauth_scopes = tool.get("oauth_scopes")
+
+            if not oauth_provider:
+                errors.append({
+                    "field": f"pending_tools[{idx}].oauth_provider",
+                    "value": oauth_provider,
+                    "message": "OAuth tools must have 'oauth_provider' field",
+                    "required_when": "requires_oauth is true"
+                })
+
+            if not isinstance(oauth_scopes, list):
+                errors.append({
+                    "field": f"pending_tools[{idx}].oauth_scopes",
+                    "value": oauth_scopes,
+                    "message": "oauth_scopes must be a list",
+                    "valid_type": "list"
+                })
+
+        # Validate tool_code if present (basic checks)
+        if "tool_code" in tool:
+            code = tool.get("tool_code")
+            if code and isinstance(code, str):
+                # Basic security checks: one scan, then report in pattern order
+                found = {m.group(0) for m in _DANGEROUS_CODE_RE.finditer(code)}
+                for pattern, msg in _DANGEROUS_CODE_PATTERNS:
+                    if pattern in found:
+                        errors.append({
+                            "field": f"pending_tools[{idx}].tool_code",
+                            "value": f"{tool_name} code",
+                            "message": msg,
+                            "security_risk": True
+                        })
+
+        validated_tools.append(tool)
+
+    # Only set cleaned value if no errors were added for this field
+    if len(errors) == errors_before:
+        cleaned[field] = validated_tools
+
+
+def _validate_string(field, value, cleaned, errors, available_models, provider) -> None:
+    # Additional validation for examples: should be numbered
+    if field == "examples" and value:
+        normalized_examples = _normalize_examples_text(value)
+        # Only need to know whether at least two lines are numbered
+        numbered = _NUMBERED_LINE_RE.finditer(normalized_examples)
+        if next(numbered, None) is None or next(numbered, None) is None:
+            errors.append({
+                "field": field,
+                "value": (normalized_examples[:100] + "...") if len(normalized_examples) > 100 else normalized_examples,
+                "message": "Examples should contain at least 2 numbered entries formatted like '1. Q: ... A: ...'",
+                "suggestion": "Provide at least two Q/A pairs and ensure each begins with a number (e.g., '1. Q: ... A: ...')."
+            })
+        else:
+            cleaned[field] = normalized_examples
+    else:
+        cleaned[field] = value
+
+
+def _passthrough(field, value, cleaned, errors, available_models, provider) -> None:
+    cleaned[field] = value
+
+
+# String fields (role, instructions, rules, behavior, examples, thinking_focus, web_search_triggers, and extended fields)
+_STRING_FIELDS = frozenset({
+    "role", "instructions", "rules", "behavior", "examples", "thinking_focus", "web_search_triggers",
+    "purpose", "where", "who", "structure", "length", "docs_data", "constraints", "errors",
+    "access_versioning", "config_status",
+})
+
+# Field name -> (required type, valid_type label, error message), checked before the field validator runs
+_EXPECTED_TYPES: Dict[str, Tuple[type, str, str]] = {
+    "tools": (list, "list", "Tools must be a list"),
+    "pending_tools": (list, "list", "pending_tools must be a list"),
+    **{field: (str, "string", f"{field.capitalize()} must be a string") for field in _STRING_FIELDS},
+}
+
+
+# Field name -> validator, run after the _EXPECTED_TYPES check
+_FIELD_VALIDATORS: Dict[str, Callable[..., None]] = {
+    "tone": _validate_tone,
+    "thinking_mode": _validate_thinking_mode,
+    "web_search": _validate_web_search,
+    **{field: _validate_range for field in FIELD_RANGES},
+    "model": _validate_model,
+    "tools": _passthrough,
+    "pending_tools": _validate_pending_tools,
+    **{field: _validate_string for field in _STRING_FIELDS},
+    # AI-generated response_message and error (not config fields)
+    "response_message": _passthrough,
+    "error": _passthrough,
+    # UI-related fields (tool_integration_data, events, etc.) - pass through as-is
+    "tool_integration_data": _passthrough,
+    "toolIntegrationData": _passthrough,
+    "events": _passthrough,
+    "wx_events": _passthrough,
+}
+# Every other allowed field (e.g. action_selection_data) passes through as-is, so the
+# table covers exactly ALLOWED_FIELDS and one lookup both filters and dispatches
+_FIELD_VALIDATORS.update({field: _passthrough for field in ALLOWED_FIELDS - _FIELD_VALIDATORS.keys()})
+
+
 def validate_config_updates(
     parsed: Dict[str, Any],
     available_models: Optional[List[str]] = None,
@@ -139,7 +486,7 @@ def validate_config_updates(
     Args:
         parsed: Parsed config updates from AI
         available_models: Optional list of available model names for the provider
-        provider: Optional LLMProvider object to fetch models if not provided
+        provider: Optional LLMProvider object whose cached models are used if not provided
         
     Returns:
         cleaned_parsed: Dict with only allowed fields and validated values
@@ -150,296 +497,33 @@ def validate_config_updates(
     errors: List[Dict[str, Any]] = []
     cleaned: Dict[str, Any] = {}
     
-    # Drop unknown fields instead of failing validation (be lenient to parser)
-    unknown_fields = set(parsed.keys()) - ALLOWED_FIELDS
+    # Drop unknown fields instead of failing validation (be lenient to parser); the loop
+    # below never dispatches them, so they only need logging and parsed is left untouched
+    unknown_fields = parsed.keys() - ALLOWED_FIELDS
     if unknown_fields:
-        try:
-            for field in list(unknown_fields):
-                logger.warning(f"Dropping unknown config field: {field}")
-                parsed.pop(field, None)
-        except Exception:
-            pass
+        logger.warning(f"Dropping unknown config fields: {', '.join(sorted(map(str, unknown_fields)))}")
     
-    # Validate each allowed field
-    for field in ALLOWED_FIELDS:
-        if field not in parsed:
-            continue
-            
-        value = parsed[field]
-        
+    # Validate each allowed field present in parsed (usually far fewer keys than ALLOWED_FIELDS)
+    for field, value in parsed.items():
         # Skip None values (they mean "don't update this field")
         if value is None:
             continue
         
-        # Validate enum fields
-        if field == "tone":
-            # Accept a single tone or up to two tones combined (e.g., "Friendly + Direct", "Friendly, Direct")
-            def _normalize_tone_string(raw: str) -> str:
-                # Replace common separators with comma, then split
-                s = str(raw)
-                # Normalize separators: +, /, |, ' and '
-                for sep in ["+", "/", "|", "&"]:
-                    s = s.replace(sep, ",")
-                s = s.replace(" and ", ",")
-                # Split, strip, title-case tokens
-                parts = [p.strip() for p in s.split(",") if p.strip()]
-                tokens = []
-                for p in parts:
-                    t = p.lower().strip()
-                    if not t:
-                        continue
-                    t = t.capitalize() if t != "ip" else t  # generic title-case; special-case if ever needed
-                    # Map common lowercase to canonical case
-                    mapping = {
-                        "casual": "Casual",
-                        "professional": "Professional",
-                        "friendly": "Friendly",
-                        "direct": "Direct",
-                        "technical": "Technical",
-                        "supportive": "Supportive",
-                    }
-                    canon = mapping.get(t.lower(), t)
-                    if canon in VALID_TONES and canon not in tokens:
-                        tokens.append(canon)
-                    # Cap at two tones
-                    if len(tokens) >= 2:
-                        break
-                return ", ".join(tokens)
-
-            normalized = _normalize_tone_string(value)
-            if not normalized:
-                errors.append({
-                    "field": field,
-                    "value": value,
-                    "message": (
-                        "Tone must be one of: " + ", ".join(sorted(VALID_TONES)) +
-                        "; optionally combine up to two (e.g., 'Friendly + Direct')."
-                    ),
-                    "valid_values": sorted(VALID_TONES)
-                })
-            else:
-                cleaned[field] = normalized
-                
-        elif field == "thinking_mode":
-            if value not in VALID_THINKING_MODES:
-                errors.append({
-                    "field": field,
-                    "value": value,
-                    "message": f"Thinking mode must be one of: {', '.join(sorted(VALID_THINKING_MODES))}",
-                    "valid_values": sorted(VALID_THINKING_MODES)
-                })
-            else:
-                # Normalize brief/detailed to internal values
-                normalized = value
-                if value == "brief":
-                    normalized = "conditional"
-                elif value == "detailed":
-                    normalized = "always"
-                cleaned[field] = normalized
-                
-        elif field == "web_search":
-            if value not in VALID_WEB_SEARCH_MODES:
-                errors.append({
-                    "field": field,
-                    "value": value,
-                    "message": f"Web search mode must be one of: {', '.join(sorted(VALID_WEB_SEARCH_MODES))}",
-                    "valid_values": sorted(VALID_WEB_SEARCH_MODES)
-                })
-            else:
-                # Normalize external labels to internal values
-                mapping = {
-                    "never": "off",
-                    "only_if_asked": "conditional",
-                    "when_unsure_or_latest": "conditional",
-                    "often": "always",
-                }
-                cleaned[field] = mapping.get(value, value)
-        
-        # Validate numeric ranges
-        elif field in FIELD_RANGES:
-            try:
-                num_value = float(value) if field != "max_tokens" else int(value)
-                range_def = FIELD_RANGES[field]
-                
-                if num_value < range_def["min"] or num_value > range_def["max"]:
-                    errors.append({
-                        "field": field,
-                        "value": value,
-                        "message": f"{field.capitalize()} must be between {range_def['min']} and {range_def['max']}",
-                        "valid_range": range_def
-                    })
-                else:
-                    cleaned[field] = num_value
-            except (ValueError, TypeError):
-                errors.append({
-                    "field": field,
-                    "value": value,
-                    "message": f"{field.capitalize()} must be a number",
-                    "valid_range": FIELD_RANGES[field]
-                })
-        
-        # Validate model name (if provided)
-        elif field == "model":
-            model_errors = validate_model_name(value, available_models, provider)
-            if model_errors:
-                errors.extend(model_errors)
-            else:
-                cleaned[field] = value
-        
-        # Validate tools (must be a list)
-        elif field == "tools":
-            if not isinstance(value, list):
-                errors.append({
-                    "field": field,
-                    "value": value,
-                    "message": "Tools must be a list",
-                    "valid_type": "list"
-                })
-            else:
-                cleaned[field] = value
-        
-        elif field == "pending_tools":
-            if not isinstance(value, list):
-                errors.append({
-                    "field": field,
-                    "value": value,
-                    "message": "pending_tools must be a list",
-                    "valid_type": "list"
-                })
-            else:
-                # Validate structure of each pending tool
-                validated_tools = []
-                for idx, tool in enumerate(value):
-                    if not isinstance(tool, dict):
-                        errors.append({
-                            "field": f"pending_tools[{idx}]",
-                            "value": tool,
-                            "message": "Each tool must be a dictionary",
-                            "valid_type": "dict"
-                        })
-                        continue
-                    
-                    # Required: tool_name or name
-                    tool_name = tool.get("tool_name") or tool.get("name")
-                    if not tool_name:
-                        errors.append({
-                            "field": f"pending_tools[{idx}]",
-                            "value": tool,
-                            "message": "Tool must have 'tool_name' or 'name' field",
-                            "required_fields": ["tool_name", "name"]
-                        })
-                        continue
-                    
-                    # Required: credential_fields must be a list if present
-                    cred_fields = tool.get("credential_fields") or tool.get("fields") or []
-                    if not isinstance(cred_fields, list):
-                        errors.append({
-                            "field": f"pending_tools[{idx}].credential_fields",
-                            "value": cred_fields,
-                            "message": "credential_fields must be a list",
-                            "valid_type": "list"
-                        })
-                        continue
-                    
-                    # OAuth validation
-                    if tool.get("requires_oauth"):
-                        oauth_provider = tool.get("oauth_provider")
-                        oauth_scopes = tool.get("oauth_scopes")
-                        
-                        if not oauth_provider:
-                            errors.append({
-                                "field": f"pending_tools[{idx}].oauth_provider",
-                                "value": oauth_provider,
-                                "message": "OAuth tools must have 'oauth_provider' field",
-                                "required_when": "requires_oauth is true"
-                            })
-                        
-                        if not isinstance(oauth_scopes, list):
-                            errors.append({
-                                "field": f"pending_tools[{idx}].oauth_scopes",
-                                "value": oauth_scopes,
-                                "message": "oauth_scopes must be a list",
-                                "valid_type": "list"
-                            })
-                    
-                    # Validate tool_code if present (basic checks)
-                    if "tool_code" in tool:
-                        code = tool.get("tool_code")
-                        if code and isinstance(code, str):
-                            # Basic security checks
-                            dangerous_patterns = [
-                                ("eval(", "eval() usage is not allowed for security"),
-                                ("exec(", "exec() usage is not allowed for security"),
-                                ("__import__", "dynamic imports not allowed for security"),
-                            ]
-                            for pattern, msg in dangerous_patterns:
-                                if pattern in code:
-                                    errors.append({
-                                        "field": f"pending_tools[{idx}].tool_code",
-                                        "value": f"{tool_name} code",
-                                        "message": msg,
-                                        "security_risk": True
-                                    })
-                    
-                    validated_tools.append(tool)
-                
-                # Only set cleaned value if no errors for this field
-                if not any(e.get("field", "").startswith("pending_tools") for e in errors):
-                    cleaned[field] = validated_tools
-        
-        # Validate string fields (role, instructions, rules, behavior, examples, thinking_focus, web_search_triggers, and extended fields)
-        elif field in {"role", "instructions", "rules", "behavior", "examples", "thinking_focus", "web_search_triggers",
-                       "purpose", "where", "who", "structure", "length", "docs_data", "constraints", "errors", "access_versioning", "config_status"}:
-            if not isinstance(value, str):
-                errors.append({
-                    "field": field,
-                    "value": value,
-                    "message": f"{field.capitalize()} must be a string",
-                    "valid_type": "string"
-                })
-            else:
-                # Additional validation for examples: should be numbered
-                if field == "examples" and value:
-                    # Handle list case - convert to string
-                    if isinstance(value, list):
-                        value = "\n".join(str(item) for item in value)
-                    # Ensure it's a string
-                    if not isinstance(value, str):
-                        value = str(value) if value else ""
-                    normalized_examples = _normalize_examples_text(value)
-                    lines = [line.strip() for line in normalized_examples.split("\n") if line.strip()]
-                    numbered_count = sum(1 for line in lines if re.match(r"^\d+\.", line))
-                    if numbered_count < 2:
-                        errors.append({
-                            "field": field,
-                            "value": (normalized_examples[:100] + "...") if len(normalized_examples) > 100 else normalized_examples,
-                            "message": "Examples should contain at least 2 numbered entries formatted like '1. Q: ... A: ...'",
-                            "suggestion": "Provide at least two Q/A pairs and ensure each begins with a number (e.g., '1. Q: ... A: ...')."
-                        })
-                    else:
-                        cleaned[field] = normalized_examples
-                else:
-                    cleaned[field] = value
+        validator = _FIELD_VALIDATORS.get(field)
+        if validator is None:
+            continue
         
-        # Allow response_message and error (AI-generated, not config fields)
-        elif field in {"response_message", "error"}:
-            cleaned[field] = value
+        expected = _EXPECTED_TYPES.get(field)
+        if expected is not None and not isinstance(value, expected[0]):
+            errors.append({
+                "field": field,
+                "value": value,
+                "message": expected[2],
+                "valid_type": expected[1]
+            })
+            continue
         
-        # Allow UI-related fields (tool_integration_data, events, etc.) - pass through as-is
-        elif field in {"tool_integration_data", "toolIntegrationData", "events", "wx_events"}:
-            cleaned[field] = value
-    
-    # Copy any remaining allowed fields that weren't handled above (pass-through for UI fields)
-    for field in ALLOWED_FIELDS:
-        if field not in cleaned and field in parsed and parsed[field] is not None:
-            # Skip fields that were already processed or are config fields
-            if field not in {"role", "instructions", "rules", "behavior", "tone", "examples", 
-                           "model", "temperature", "max_tokens", "top_p", "frequency_penalty",
-                           "thinking_mode", "thinking_focus", "web_search", "web_search_triggers",
-                           "tools", "pending_tools", "response_message", "error",
-                           "tool_integration_data", "toolIntegrationData", "events", "wx_events"}:
-                # This shouldn't happen, but just in case, pass through
-                cleaned[field] = parsed[field]
+        validator(field, value, cleaned, errors, available_models, provider)
     
     if errors:
         raise ValidationError(errors)
@@ -447,6 +531,13 @@ def validate_config_updates(
     return cleaned
 
 
+@lru_cache(maxsize=32)
+def _model_lookup(models: Tuple[str, ...]) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """Lowercased model names, and the bare names after a provider prefix, for one model list."""
+    lowered = frozenset(m.lower() for m in models)
+    return lowered, frozenset(m.rsplit("/", 1)[-1] for m in lowered if "/" in m)
+
+
 def validate_model_name(
     model: str,
     available_models: Optional[List[str]] = None,
@@ -458,7 +549,7 @@ def validate_model_name(
     Args:
         model: Model name to validate
         available_models: Optional list of available models
-        provider: Optional LLMProvider to fetch models if not provided
+        provider: Optional LLMProvider whose cached models are used if not provided
         
     Returns:
         List of error details (empty if valid)
@@ -474,27 +565,28 @@ def validate_model_name(
         })
         return errors
     
-    # Fetch models if not provided
+    # Fall back to the provider's cached model list if none was provided (callers fetch it
+    # with model_catalog.get_available_models first; this stays sync and never blocks on HTTP).
+    # A cold cache (e.g. the fetch failed) falls back to the same built-in list the catalog uses
     if not available_models and provider:
-        try:
-            available_models = get_available_models(provider)
-        except Exception as e:
-            logger.warning(f"Failed to fetch available models for provider {provider.id}: {e}")
-            available_models = []
+        available_models = get_cached_models(provider.id) or get_fallback_models(provider.provider_name)
     
     # If we have available models, check against them
     if available_models:
-        # Normalize model names for comparison (remove provider prefix if present)
-        normalized_available = [m.lower().replace("/", "/") for m in available_models]
+        # Match exactly or by the part after a provider prefix
+        lowered, bare_names = _model_lookup(tuple(available_models))
         normalized_model = model.lower()
         
-        # Check exact match or partial match (for provider-prefixed models)
-        matches = [
-            m for m in available_models
-            if m.lower() == normalized_model or m.lower().endswith("/" + normalized_model)
-        ]
+        if normalized_model in lowered:
+            matched = True
+        elif "/" not in normalized_model:
+            matched = normalized_model in bare_names
+        else:
+            # Prefixed input (e.g. "meta/llama") can only match as a full suffix
+            suffix = "/" + normalized_model
+            matched = any(m.endswith(suffix) for m in lowered)
         
-        if not matches:
+        if not matched:
             errors.append({
                 "field": "model",
                 "value": model,
@@ -502,10 +594,16 @@ def validate_model_name(
                 "available_models": available_models[:10],  # Show first 10
                 "suggestion": f"Choose from available models: {', '.join(available_models[:5])}"
             })
+    elif provider:
+        # The provider's model list is unavailable: refuse rather than accept any model unchecked
+        errors.append({
+            "field": "model",
+            "value": model,
+            "message": f"Could not verify model '{model}' for this provider; its model list is unavailable"
+        })
     else:
-        # No available models list - can't validate, but log warning
+        # No provider and no available models list - nothing to check against, but log warning
         logger.warning(f"Could not validate model '{model}' - no available models list provided")
-        # Don't fail validation if we can't check, but log it
     
     return errors
 
@@ -532,12 +630,6 @@ def sanitize_chat_logs(logs: List[Dict[str, Any]], max_logs: int = 5, max_messag
     # Limit to last N logs
     limited_logs = logs[-max_logs:] if len(logs) > max_logs else logs
     
-    # Patterns to remove (API keys, tokens, etc.)
-    api_key_pattern = re.compile(r'(?i)(api[_-]?key|bearer|token|secret|password|auth)[\s:=]+["\']?[a-zA-Z0-9_\-]{20,}["\']?', re.IGNORECASE)
-    email_pattern = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
-    phone_pattern = re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b')
-    ssn_pattern = re.compile(r'\b\d{3}-\d{2}-\d{4}\b')
-    
     sanitized = []
     for log in limited_logs:
         sanitized_log = {}
@@ -548,29 +640,13 @@ def sanitize_chat_logs(logs: List[Dict[str, Any]], max_logs: int = 5, max_messag
         
         # Sanitize user message
         if "user_message" in log and log["user_message"]:
-            user_msg = str(log["user_message"])
-            # Remove sensitive patterns
-            user_msg = api_key_pattern.sub("[REDACTED]", user_msg)
-            user_msg = email_pattern.sub("[EMAIL]", user_msg)
-            user_msg = phone_pattern.sub("[PHONE]", user_msg)
-            user_msg = ssn_pattern.sub("[SSN]", user_msg)
-            # Truncate
-            if len(user_msg) > max_message_length:
-                user_msg = user_msg[:max_message_length] + "..."
-            sanitized_log["user_message"] = user_msg
+            # Remove sensitive patterns (API keys, tokens, emails, phones, SSNs), then truncate
+            sanitized_log["user_message"] = _redact_and_truncate(str(log["user_message"]), max_message_length)
         
         # Sanitize assistant response
         if "assistant_response" in log and log["assistant_response"]:
-            assistant_msg = str(log["assistant_response"])
-            # Remove sensitive patterns
-            assistant_msg = api_key_pattern.sub("[REDACTED]", assistant_msg)
-            assistant_msg = email_pattern.sub("[EMAIL]", assistant_msg)
-            assistant_msg = phone_pattern.sub("[PHONE]", assistant_msg)
-            assistant_msg = ssn_pattern.sub("[SSN]", assistant_msg)
-            # Truncate
-            if len(assistant_msg) > max_message_length:
-                assistant_msg = assistant_msg[:max_message_length] + "..."
-            sanitized_log["assistant_response"] = assistant_msg
+            # Remove sensitive patterns (API keys, tokens, emails, phones, SSNs), then truncate
+            sanitized_log["assistant_response"] = _redact_and_truncate(str(log["assistant_response"]), max_message_length)
         
         # Don't include tokens_used, status_code, or other metadata
         # Only include essential conversation context
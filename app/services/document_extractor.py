@@ -1,15 +1,15 @@
 """Utility helpers to extract readable text previews from uploaded documents."""
 from __future__ import annotations
 
-import base64
+import binascii
 import io
 import logging
-from typing import Optional
+from typing import Any, Callable, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
 
-TEXT_EXTENSIONS = {
+TEXT_EXTENSIONS = frozenset({
     "txt",
     "md",
     "markdown",
@@ -20,33 +20,41 @@ TEXT_EXTENSIONS = {
     "yaml",
     "yml",
     "ini",
-}
+})
 
 TEXT_MIME_PREFIXES = ("text/",)
-TEXT_MIME_EXTRAS = {
+TEXT_MIME_EXTRAS = frozenset({
     "application/json",
     "application/xml",
-}
+})
 
 
 def _decode_base64(data: str) -> Optional[bytes]:
     try:
-        return base64.b64decode(data)
+        # Same non-validating decode as base64.b64decode, without its str->bytes wrapper copy
+        return binascii.a2b_base64(data)
     except Exception as exc:  # pragma: no cover - defensive
         logger.warning("Failed to decode base64 document: %s", exc)
         return None
 
 
+def _resolve_raw(content_b64: Optional[str], content_bytes: Optional[bytes]) -> Optional[bytes]:
+    """Use already-decoded bytes when the caller has them, else decode the base64 payload."""
+    if content_bytes is not None:
+        return content_bytes
+    if not content_b64:
+        return None
+    return _decode_base64(content_b64)
+
+
 def _is_text_like(file_type: Optional[str], mime_type: Optional[str]) -> bool:
-    ft = (file_type or "").lower()
-    mime = (mime_type or "").lower()
-    if ft in TEXT_EXTENSIONS:
-        return True
-    if any(mime.startswith(prefix) for prefix in TEXT_MIME_PREFIXES):
-        return True
-    if mime in TEXT_MIME_EXTRAS:
+    if file_type and file_type.lower() in TEXT_EXTENSIONS:
         return True
-    return False
+    if not mime_type:
+        return False
+    mime = mime_type.lower()
+    # str.startswith takes the prefix tuple directly, no generator needed
+    return mime.startswith(TEXT_MIME_PREFIXES) or mime in TEXT_MIME_EXTRAS
 
 
 def _extract_text_bytes(raw: bytes, encoding: str = "utf-8") -> Optional[str]:
@@ -57,7 +65,32 @@ def _extract_text_bytes(raw: bytes, encoding: str = "utf-8") -> Optional[str]:
         return None
 
 
+def _extract_pdf_pdfium(raw: bytes) -> Optional[str]:
+    """Extract PDF text with PDFium when pypdfium2 is installed (much faster than PyPDF2)."""
+    import pypdfium2 as pdfium  # type: ignore
+
+    pdf = pdfium.PdfDocument(raw)
+    try:
+        pages = []
+        for page in pdf:
+            textpage = page.get_textpage()
+            text = textpage.get_text_range() or ""
+            textpage.close()
+            page.close()
+            pages.append(text.replace("\r\n", "\n").strip())
+        return "\n".join(filter(None, pages)) or None
+    finally:
+        pdf.close()
+
+
 def _extract_pdf(raw: bytes) -> Optional[str]:
+    try:
+        return _extract_pdf_pdfium(raw)
+    except ImportError:
+        pass
+    except Exception as exc:  # pragma: no cover - best-effort
+        logger.warning("PDFium extraction failed, falling back to PyPDF2: %s", exc)
+
     try:
         from PyPDF2 import PdfReader
 
@@ -88,23 +121,41 @@ def _extract_docx(raw: bytes) -> Optional[str]:
     return None
 
 
-def _extract_xlsx(raw: bytes, max_rows: int = 50, max_cols: int = 10) -> Optional[str]:
+def _extract_xlsx(
+    raw: bytes,
+    max_rows: int = 50,
+    max_cols: int = 10,
+    mark_truncation: bool = False,
+) -> Optional[str]:
+    """Extract the active sheet as comma-joined rows.
+
+    With ``mark_truncation`` the rows/columns past the limits are flagged with
+    "..." markers instead of being dropped silently.
+    """
     try:
         from openpyxl import load_workbook  # type: ignore
 
         wb = load_workbook(filename=io.BytesIO(raw), read_only=True, data_only=True)
         sheet = wb.active
         rows = []
-        for ridx, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+        # Bounds go to openpyxl so it stops parsing and padding past them
+        if mark_truncation:
+            # Read one row/column past the limits so truncation can be reported; the
+            # column bound only applies when the sheet is known to be wider, since
+            # openpyxl pads rows out to max_col
+            wide = (sheet.max_column or 0) > max_cols
+            row_iter = sheet.iter_rows(
+                values_only=True, max_row=max_rows + 1, max_col=max_cols + 1 if wide else None
+            )
+        else:
+            row_iter = sheet.iter_rows(values_only=True, max_row=max_rows, max_col=max_cols)
+        for ridx, row in enumerate(row_iter, start=1):
             if ridx > max_rows:
+                rows.append(f"... (truncated at {max_rows} rows)")
                 break
-            values = []
-            for cidx, cell in enumerate(row, start=1):
-                if cidx > max_cols:
-                    break
-                if cell is None:
-                    continue
-                values.append(str(cell))
+            values = [str(cell) for cell in row[:max_cols] if cell is not None]
+            if len(row) > max_cols:
+                values.append("...")
             if values:
                 rows.append(", ".join(values))
         wb.close()
@@ -123,36 +174,53 @@ def _clean_preview(text: str, max_chars: int) -> str:
     return collapsed
 
 
+# File extension -> binary-format extractor; anything else is decoded as text
+_EXTRACTORS: Dict[str, Callable[..., Optional[str]]] = {
+    "pdf": _extract_pdf,
+    "docx": _extract_docx,
+    "xlsx": _extract_xlsx,
+    "xlsm": _extract_xlsx,
+}
+# For Excel, extract more rows/cols for full content
+_XLSX_FULL_KWARGS = {"max_rows": 10000, "max_cols": 100, "mark_truncation": True}
+_FULL_TEXT_KWARGS: Dict[str, Dict[str, Any]] = {
+    "xlsx": _XLSX_FULL_KWARGS,
+    "xlsm": _XLSX_FULL_KWARGS,
+}
+
+
+def _extract_text(raw: bytes, file_type: Optional[str], mime_type: Optional[str], *, full: bool) -> Optional[str]:
+    """Shared extraction core; ``full`` only widens the spreadsheet limits."""
+    if _is_text_like(file_type, mime_type):
+        return _extract_text_bytes(raw)
+
+    ft = (file_type or "").lower()
+    extractor = _EXTRACTORS.get(ft)
+    if extractor is None:
+        # fall back to naive utf-8 decode; may still succeed for many formats
+        return _extract_text_bytes(raw)
+    if full:
+        return extractor(raw, **_FULL_TEXT_KWARGS.get(ft, {}))
+    return extractor(raw)
+
+
 def extract_text_preview(
     *,
     content_b64: Optional[str],
     file_type: Optional[str],
     mime_type: Optional[str],
     max_chars: int = 2000,
+    content_bytes: Optional[bytes] = None,
 ) -> Optional[str]:
-    """Attempt to extract a readable preview (2000 chars default) from a document."""
-    if not content_b64:
-        return None
+    """Attempt to extract a readable preview (2000 chars default) from a document.
 
-    raw = _decode_base64(content_b64)
+    Pass ``content_bytes`` instead of ``content_b64`` to skip the base64 decode.
+    """
+    raw = _resolve_raw(content_b64, content_bytes)
     if not raw:
         return None
 
-    text: Optional[str] = None
-    ft = (file_type or "").lower()
-
-    if _is_text_like(file_type, mime_type):
-        text = _extract_text_bytes(raw)
-    elif ft in {"pdf"}:
-        text = _extract_pdf(raw)
-    elif ft in {"docx"}:
-        text = _extract_docx(raw)
-    elif ft in {"xlsx", "xlsm"}:
-        text = _extract_xlsx(raw)
-    else:
-        # fall back to naive utf-8 decode; may still succeed for many formats
-        text = _extract_text_bytes(raw)
-
+    text = _extract_text(raw, file_type, mime_type, full=False)
     if not text:
         return None
     cleaned = _clean_preview(text, max_chars)
@@ -164,64 +232,19 @@ def extract_full_text(
     content_b64: Optional[str],
     file_type: Optional[str],
     mime_type: Optional[str],
+    content_bytes: Optional[bytes] = None,
 ) -> Optional[str]:
-    """Extract the full text content from a document (no truncation)."""
-    if not content_b64:
-        return None
+    """Extract the full text content from a document (no truncation).
 
-    raw = _decode_base64(content_b64)
+    Pass ``content_bytes`` instead of ``content_b64`` to skip the base64 decode.
+    """
+    raw = _resolve_raw(content_b64, content_bytes)
     if not raw:
         return None
 
-    text: Optional[str] = None
-    ft = (file_type or "").lower()
-
-    if _is_text_like(file_type, mime_type):
-        text = _extract_text_bytes(raw)
-    elif ft in {"pdf"}:
-        text = _extract_pdf(raw)
-    elif ft in {"docx"}:
-        text = _extract_docx(raw)
-    elif ft in {"xlsx", "xlsm"}:
-        # For Excel, extract more rows/cols for full content
-        text = _extract_xlsx_full(raw)
-    else:
-        # fall back to naive utf-8 decode; may still succeed for many formats
-        text = _extract_text_bytes(raw)
-
+    text = _extract_text(raw, file_type, mime_type, full=True)
     if not text:
         return None
     
     # Return full text, cleaned but not truncated
     return text.strip() or None
-
-
-def _extract_xlsx_full(raw: bytes, max_rows: int = 10000, max_cols: int = 100) -> Optional[str]:
-    """Extract full content from Excel file (larger limits)."""
-    try:
-        from openpyxl import load_workbook  # type: ignore
-
-        wb = load_workbook(filename=io.BytesIO(raw), read_only=True, data_only=True)
-        sheet = wb.active
-        rows = []
-        for ridx, row in enumerate(sheet.iter_rows(values_only=True), start=1):
-            if ridx > max_rows:
-                rows.append(f"... (truncated at {max_rows} rows)")
-                break
-            values = []
-            for cidx, cell in enumerate(row, start=1):
-                if cidx > max_cols:
-                    values.append("...")
-                    break
-                if cell is None:
-                    continue
-                values.append(str(cell))
-            if values:
-                rows.append(", ".join(values))
-        wb.close()
-        return "\n".join(rows) or None
-    except ImportError:
-        logger.warning("openpyxl not installed; skipping XLSX extraction")
-    except Exception as exc:
-        logger.warning("XLSX extraction failed: %s", exc)
-    return None
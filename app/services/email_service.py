@@ -1,11 +1,16 @@
 import smtplib
 import logging
+import re
+import threading
+import atexit
+from concurrent.futures import Future, ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
 from typing import Optional, Dict, Any
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from html.parser import HTMLParser
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
 from app.config import settings
 import os
 
@@ -13,11 +18,43 @@ logger = logging.getLogger(__name__)
 
 # Setup Jinja2 environment for email templates
 template_dir = Path(__file__).parent.parent / "templates" / "emails"
+# Compiled templates persist across restarts in jinja2's per-user temp cache dir; templates
+# ship with the code, so skip the per-render mtime check (auto_reload) as well
 env = Environment(
     loader=FileSystemLoader(str(template_dir)),
-    autoescape=select_autoescape(['html', 'xml'])
+    autoescape=select_autoescape(['html', 'xml']),
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=False,
 )
 
+SMTP_TIMEOUT_SECONDS = 10
+
+_WS_RE = re.compile(r'\s+')
+
+
+class _TextExtractor(HTMLParser):
+    """Collects text content in one pass, skipping <script> and <style> bodies."""
+
+    _SKIP_TAGS = frozenset({"script", "style"})
+
+    def __init__(self):
+        # convert_charrefs decodes every HTML entity in the collected text
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
 
 class EmailService:
     """Service for sending emails via SMTP"""
@@ -30,22 +67,61 @@ class EmailService:
         self.from_email = settings.smtp_from_email or settings.smtp_user
         self.from_name = settings.smtp_from_name or "Wrap-X Team"
         self.use_tls = settings.smtp_use_tls
+        # One authenticated SMTP connection per thread, reused across sends
+        self._local = threading.local()
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        atexit.register(self.close)
+        # Single background sender: keeps SMTP off the request path and reuses one connection
+        self._outbox = ThreadPoolExecutor(max_workers=1, thread_name_prefix="email-outbox")
         
     def _get_smtp_connection(self):
-        """Create and return SMTP connection"""
+        """Return this thread's pooled SMTP connection, reconnecting if it has gone stale"""
         if not all([self.smtp_host, self.smtp_user, self.smtp_password]):
             logger.warning("SMTP configuration incomplete. Email sending disabled.")
             return None
+        
+        server = getattr(self._local, "server", None)
+        if server is not None:
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard_connection(server)
             
         try:
-            server = smtplib.SMTP(self.smtp_host, self.smtp_port)
+            # Timeout so a dead pooled socket raises (and is discarded) instead of blocking forever
+            server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=SMTP_TIMEOUT_SECONDS)
             if self.use_tls:
                 server.starttls()
             server.login(self.smtp_user, self.smtp_password)
-            return server
         except Exception as e:
             logger.error(f"Failed to connect to SMTP server: {e}")
             return None
+        
+        self._local.server = server
+        with self._connections_lock:
+            self._connections.add(server)
+        return server
+    
+    def _discard_connection(self, server) -> None:
+        """Drop a pooled connection (best-effort QUIT)"""
+        if getattr(self._local, "server", None) is server:
+            self._local.server = None
+        with self._connections_lock:
+            self._connections.discard(server)
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+    
+    def close(self) -> None:
+        """Close every pooled SMTP connection (registered to run at interpreter exit)"""
+        with self._connections_lock:
+            servers = list(self._connections)
+        for server in servers:
+            self._discard_connection(server)
     
     def _render_template(self, template_name: str, context: Dict[str, Any]) -> str:
         """Render email template with context"""
@@ -99,8 +175,12 @@ class EmailService:
             if not server:
                 return False
                 
-            server.send_message(msg)
-            server.quit()
+            try:
+                server.send_message(msg)
+            except Exception:
+                # Don't hand a connection in an unknown state to the next send
+                self._discard_connection(server)
+                raise
             
             logger.info(f"Email sent successfully to {to_email}")
             return True
@@ -146,23 +226,40 @@ class EmailService:
             logger.error(f"Failed to send template email {template_name} to {to_email}: {e}")
             return False
     
+    def queue_template_email(
+        self,
+        to_email: str,
+        template_name: str,
+        subject: str,
+        context: Dict[str, Any]
+    ) -> Future:
+        """
+        Render and send a template email on the background sender thread.
+        
+        Returns immediately; the Future resolves to send_template_email's result.
+        Queued emails are still delivered when the process shuts down.
+        Callers no longer see send failures, so they are logged when the Future settles.
+        """
+        future = self._outbox.submit(self.send_template_email, to_email, template_name, subject, context)
+        
+        def _report(done: Future) -> None:
+            error = done.exception()
+            if error is not None:
+                logger.error(f"Queued email {template_name} to {to_email} raised: {error}")
+            elif not done.result():
+                logger.error(f"Queued email {template_name} to {to_email} was not sent")
+        
+        future.add_done_callback(_report)
+        return future
+    
     def _html_to_text(self, html: str) -> str:
         """Simple HTML to text converter"""
-        import re
-        # Remove script and style elements
-        html = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL | re.IGNORECASE)
-        html = re.sub(r'<style[^>]*>.*?</style>', '', html, flags=re.DOTALL | re.IGNORECASE)
-        # Remove HTML tags
-        text = re.sub(r'<[^>]+>', '', html)
-        # Decode HTML entities
-        text = text.replace('&nbsp;', ' ')
-        text = text.replace('&amp;', '&')
-        text = text.replace('&lt;', '<')
-        text = text.replace('&gt;', '>')
-        text = text.replace('&quot;', '"')
-        # Clean up whitespace
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
+        # Single parse: drops tags, script/style bodies and comments, decodes entities
+        parser = _TextExtractor()
+        parser.feed(html)
+        parser.close()
+        # Clean up whitespace (&nbsp; decodes to U+00A0, which \s also matches)
+        return _WS_RE.sub(' ', ''.join(parser.parts)).strip()
 
 
 # Global email service instance
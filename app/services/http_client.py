@@ -0,0 +1,32 @@
+"""
+Shared outbound HTTP client for provider API calls (credential tests, model listing)
+"""
+import httpx
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Optional
+
+# Shared client so repeat calls to the same host reuse pooled keep-alive connections
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get or create the shared async HTTP client"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            # Concurrent calls to one host multiplex over a single connection
+            http2=True,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=30),
+            # The client is shared across users: never store cookies from one call for the next
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared client (called on app shutdown)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -1,13 +1,34 @@
 """
 Service for testing integration credentials
 """
+import asyncio
+import hashlib
 import logging
 import httpx
 import json
-from typing import Dict, Any, Tuple
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.services.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
+# Concurrency limits for test_integrations_bulk: overall, and per provider (tester)
+_BULK_MAX_CONCURRENCY = 16
+_BULK_MAX_PER_PROVIDER = 4
+
+# Successful test results: sha256(tool name + credentials) -> (expires_at_epoch, result).
+# Repeat tests within the TTL skip the remote call (and the provider's rate limits);
+# failures are never cached so a fixed credential is re-tested right away.
+_RESULT_CACHE_TTL_SECONDS = 300
+_RESULT_CACHE_MAX_ENTRIES = 1024
+_result_cache: Dict[str, Tuple[float, Tuple[bool, str]]] = {}
+
+
+def _result_cache_key(tool_name: str, credentials: Dict[str, Any]) -> str:
+    payload = json.dumps(credentials, sort_keys=True, default=str)
+    return hashlib.sha256(f"{tool_name}\0{payload}".encode()).hexdigest()
+
 
 async def test_integration_credentials(
     tool_name: str,
@@ -21,80 +42,67 @@ async def test_integration_credentials(
     tool_name_lower = tool_name.lower()
     
     try:
-        # Gmail / Google Services
-        if 'gmail' in tool_name_lower or 'google' in tool_name_lower:
-            return await _test_google_credentials(credentials)
-        
-        # Shopify
-        elif 'shopify' in tool_name_lower:
-            return await _test_shopify_credentials(credentials)
-        
-        # Airtable
-        elif 'airtable' in tool_name_lower:
-            return await _test_airtable_credentials(credentials)
-        
-        # Notion
-        elif 'notion' in tool_name_lower:
-            return await _test_notion_credentials(credentials)
-        
-        # PostgreSQL
-        elif 'postgres' in tool_name_lower or 'postgresql' in tool_name_lower:
-            return await _test_postgresql_credentials(credentials)
-        
-        # MySQL
-        elif 'mysql' in tool_name_lower:
-            return await _test_mysql_credentials(credentials)
-        
-        # MongoDB
-        elif 'mongo' in tool_name_lower:
-            return await _test_mongodb_credentials(credentials)
-        
-        # Slack
-        elif 'slack' in tool_name_lower:
-            return await _test_slack_credentials(credentials)
-        
-        # GitHub
-        elif 'github' in tool_name_lower:
-            return await _test_github_credentials(credentials)
-        
-        # Stripe
-        elif 'stripe' in tool_name_lower:
-            return await _test_stripe_credentials(credentials)
-        
-        # Twilio
-        elif 'twilio' in tool_name_lower:
-            return await _test_twilio_credentials(credentials)
-        
-        # SendGrid
-        elif 'sendgrid' in tool_name_lower:
-            return await _test_sendgrid_credentials(credentials)
-        
-        # Discord
-        elif 'discord' in tool_name_lower:
-            return await _test_discord_credentials(credentials)
-        
-        # Dropbox
-        elif 'dropbox' in tool_name_lower:
-            return await _test_dropbox_credentials(credentials)
-        
-        # AWS S3
-        elif 'aws' in tool_name_lower or 's3' in tool_name_lower:
-            return await _test_aws_credentials(credentials)
-        
-        # Generic API key validation
-        elif 'api_key' in credentials or 'apiKey' in credentials:
-            return await _test_generic_api_key(tool_name, credentials)
-        
-        # Default: basic validation
-        else:
-            return await _test_basic_validation(credentials)
+        tester = _find_tester(tool_name_lower)
+        if tester is None:
+            # No service-specific tester: format-only checks, nothing to await or cache
+            if 'api_key' in credentials or 'apiKey' in credentials:
+                return _validate_generic_api_key(tool_name, credentials)
+            return _validate_basic_credentials(credentials)
+        if tester in _FORMAT_VALIDATORS:
+            return tester(credentials)
+        
+        cache_key = _result_cache_key(tool_name, credentials)
+        cached = _result_cache.get(cache_key)
+        if cached is not None and cached[0] > time.time():
+            return cached[1]
+        
+        result = await tester(credentials)
+        if result[0]:
+            if len(_result_cache) >= _RESULT_CACHE_MAX_ENTRIES:
+                _result_cache.pop(next(iter(_result_cache)))
+            _result_cache[cache_key] = (time.time() + _RESULT_CACHE_TTL_SECONDS, result)
+        return result
             
     except Exception as e:
         logger.error(f"Error testing {tool_name} credentials: {e}")
         return False, f"Test failed: {str(e)[:200]}"
 
 
-async def _test_google_credentials(credentials: Dict[str, Any]) -> Tuple[bool, str]:
+@lru_cache(maxsize=256)
+def _find_tester(tool_name_lower: str) -> Optional[Callable[[Dict[str, Any]], Any]]:
+    """First tester whose keyword appears in the tool name (memoized: tool names repeat)"""
+    for keywords, tester in _CREDENTIAL_TESTERS:
+        if any(keyword in tool_name_lower for keyword in keywords):
+            return tester
+    return None
+
+
+async def test_integrations_bulk(
+    items: List[Tuple[str, Dict[str, Any], Optional[str]]]
+) -> List[Tuple[bool, str]]:
+    """
+    Test several integrations concurrently.
+    Takes (tool_name, credentials, tool_code) tuples and returns their
+    (success, message) results in the same order.
+    """
+    # Each test is mostly network wait, so the batch takes roughly as long as the slowest one.
+    # Concurrency is capped overall and per provider so a large batch doesn't trip rate limits
+    # (a 429 would show up as a failed test)
+    batch_sem = asyncio.Semaphore(_BULK_MAX_CONCURRENCY)
+    provider_sems: Dict[Any, asyncio.Semaphore] = {}
+    
+    async def run(name: str, creds: Dict[str, Any], code: Optional[str]) -> Tuple[bool, str]:
+        tester = _find_tester(name.lower())
+        provider_sem = provider_sems.setdefault(tester, asyncio.Semaphore(_BULK_MAX_PER_PROVIDER))
+        # Provider slot first, so tests queued behind a busy provider don't hold batch slots
+        async with provider_sem:
+            async with batch_sem:
+                return await test_integration_credentials(name, creds, code)
+    
+    return await asyncio.gather(*(run(name, creds, code) for name, creds, code in items))
+
+
+def _validate_google_format(credentials: Dict[str, Any]) -> Tuple[bool, str]:
     """Test Google/Gmail OAuth credentials"""
     try:
         required_fields = ['client_id', 'client_secret']
@@ -130,24 +138,21 @@ async def _test_shopify_credentials(credentials: Dict[str, Any]) -> Tuple[bool,
             shop_url = f"{shop_url}.myshopify.com"
         
         # Test API call
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"{shop_url}/admin/api/2024-01/shop.json",
-                headers={
-                    "X-Shopify-Access-Token": access_token,
-                    "Content-Type": "application/json"
-                }
-            )
+        client = get_http_client()
+        response = await client.get(
+            f"{shop_url}/admin/api/2024-01/shop.json",
+            headers={"X-Shopify-Access-Token": access_token}
+        )
+        
+        if response.status_code == 200:
+            return True, "Shopify credentials are valid and working"
+        elif response.status_code == 401:
+            return False, "Invalid access token"
+        elif response.status_code == 404:
+            return False, "Shop not found. Check your shop URL"
+        else:
+            return False, f"API returned status {response.status_code}"
             
-            if response.status_code == 200:
-                return True, "Shopify credentials are valid and working"
-            elif response.status_code == 401:
-                return False, "Invalid access token"
-            elif response.status_code == 404:
-                return False, "Shop not found. Check your shop URL"
-            else:
-                return False, f"API returned status {response.status_code}"
-                
     except httpx.TimeoutException:
         return False, "Connection timeout. Check your shop URL"
     except Exception as e:
@@ -168,20 +173,20 @@ async def _test_airtable_credentials(credentials: Dict[str, Any]) -> Tuple[bool,
         
         if base_id:
             # Test with base
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(
-                    f"https://api.airtable.com/v0/meta/bases/{base_id}/tables",
-                    headers={"Authorization": f"Bearer {api_key}"}
-                )
-                
-                if response.status_code == 200:
-                    return True, "Airtable credentials are valid"
-                elif response.status_code == 401:
-                    return False, "Invalid API key"
-                elif response.status_code == 404:
-                    return False, "Base not found"
-                else:
-                    return False, f"API returned status {response.status_code}"
+            client = get_http_client()
+            response = await client.get(
+                f"https://api.airtable.com/v0/meta/bases/{base_id}/tables",
+                headers={"Authorization": f"Bearer {api_key}"}
+            )
+            
+            if response.status_code == 200:
+                return True, "Airtable credentials are valid"
+            elif response.status_code == 401:
+                return False, "Invalid API key"
+            elif response.status_code == 404:
+                return False, "Base not found"
+            else:
+                return False, f"API returned status {response.status_code}"
         else:
             return True, "API key format is valid. Add base_id for full verification."
             
@@ -200,22 +205,22 @@ async def _test_notion_credentials(credentials: Dict[str, Any]) -> Tuple[bool, s
         if not token.startswith('secret_'):
             return False, "Invalid token format. Notion tokens start with 'secret_'"
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                "https://api.notion.com/v1/users/me",
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Notion-Version": "2022-06-28"
-                }
-            )
+        client = get_http_client()
+        response = await client.get(
+            "https://api.notion.com/v1/users/me",
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Notion-Version": "2022-06-28"
+            }
+        )
+        
+        if response.status_code == 200:
+            return True, "Notion credentials are valid"
+        elif response.status_code == 401:
+            return False, "Invalid integration token"
+        else:
+            return False, f"API returned status {response.status_code}"
             
-            if response.status_code == 200:
-                return True, "Notion credentials are valid"
-            elif response.status_code == 401:
-                return False, "Invalid integration token"
-            else:
-                return False, f"API returned status {response.status_code}"
-                
     except Exception as e:
         return False, f"Test error: {str(e)[:100]}"
 
@@ -240,12 +245,18 @@ async def _test_postgresql_credentials(credentials: Dict[str, Any]) -> Tuple[boo
             database=database,
             user=user,
             password=password,
-            timeout=10
+            timeout=10,
+            command_timeout=5,
+            statement_cache_size=0
         )
-        await conn.execute('SELECT 1')
-        await conn.close()
+        try:
+            # One round trip for the connectivity check and the diagnostics
+            row = await conn.fetchrow('SELECT current_database(), version()')
+        finally:
+            await conn.close()
         
-        return True, "PostgreSQL connection successful"
+        server_version = (row[1] or '').split(' on ')[0]
+        return True, f"PostgreSQL connection successful ({row[0]}, {server_version})"
         
     except ImportError:
         return True, "Database credentials format is valid. Install asyncpg for full testing."
@@ -283,11 +294,15 @@ async def _test_mysql_credentials(credentials: Dict[str, Any]) -> Tuple[bool, st
             password=password,
             connect_timeout=10
         )
-        async with conn.cursor() as cursor:
-            await cursor.execute('SELECT 1')
-        conn.close()
+        try:
+            async with conn.cursor() as cursor:
+                # One round trip for the connectivity check and the diagnostics
+                await cursor.execute('SELECT DATABASE(), VERSION()')
+                row = await cursor.fetchone()
+        finally:
+            conn.close()
         
-        return True, "MySQL connection successful"
+        return True, f"MySQL connection successful ({row[0]}, MySQL {row[1]})"
         
     except ImportError:
         return True, "Database credentials format is valid. Install aiomysql for full testing."
@@ -314,9 +329,13 @@ async def _test_mongodb_credentials(credentials: Dict[str, Any]) -> Tuple[bool,
         if not connection_string.startswith('mongodb'):
             return False, "Invalid connection string format. Should start with mongodb:// or mongodb+srv://"
         
+        # Closed right after the ping: an open client keeps monitoring every cluster member.
+        # Repeat tests are served by the result cache instead.
         client = AsyncIOMotorClient(connection_string, serverSelectionTimeoutMS=10000)
-        await client.admin.command('ping')
-        client.close()
+        try:
+            await client.admin.command('ping')
+        finally:
+            client.close()
         
         return True, "MongoDB connection successful"
         
@@ -337,21 +356,21 @@ async def _test_slack_credentials(credentials: Dict[str, Any]) -> Tuple[bool, st
         if not token.startswith('xoxb-'):
             return False, "Invalid token format. Slack bot tokens start with 'xoxb-'"
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                "https://slack.com/api/auth.test",
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('ok'):
-                    return True, f"Slack credentials valid for team: {data.get('team', 'Unknown')}"
-                else:
-                    return False, f"Invalid token: {data.get('error', 'Unknown error')}"
+        client = get_http_client()
+        response = await client.post(
+            "https://slack.com/api/auth.test",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            if data.get('ok'):
+                return True, f"Slack credentials valid for team: {data.get('team', 'Unknown')}"
             else:
-                return False, f"API returned status {response.status_code}"
-                
+                return False, f"Invalid token: {data.get('error', 'Unknown error')}"
+        else:
+            return False, f"API returned status {response.status_code}"
+            
     except Exception as e:
         return False, f"Test error: {str(e)[:100]}"
 
@@ -364,23 +383,23 @@ async def _test_github_credentials(credentials: Dict[str, Any]) -> Tuple[bool, s
         if not token:
             return False, "Missing personal_access_token"
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                "https://api.github.com/user",
-                headers={
-                    "Authorization": f"token {token}",
-                    "Accept": "application/vnd.github.v3+json"
-                }
-            )
+        client = get_http_client()
+        response = await client.get(
+            "https://api.github.com/user",
+            headers={
+                "Authorization": f"token {token}",
+                "Accept": "application/vnd.github.v3+json"
+            }
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            return True, f"GitHub credentials valid for user: {data.get('login', 'Unknown')}"
+        elif response.status_code == 401:
+            return False, "Invalid personal access token"
+        else:
+            return False, f"API returned status {response.status_code}"
             
-            if response.status_code == 200:
-                data = response.json()
-                return True, f"GitHub credentials valid for user: {data.get('login', 'Unknown')}"
-            elif response.status_code == 401:
-                return False, "Invalid personal access token"
-            else:
-                return False, f"API returned status {response.status_code}"
-                
     except Exception as e:
         return False, f"Test error: {str(e)[:100]}"
 
@@ -393,22 +412,22 @@ async def _test_stripe_credentials(credentials: Dict[str, Any]) -> Tuple[bool, s
         if not api_key:
             return False, "Missing api_key or secret_key"
         
-        if not (api_key.startswith('sk_test_') or api_key.startswith('sk_live_')):
+        if not api_key.startswith(('sk_test_', 'sk_live_')):
             return False, "Invalid API key format. Should start with sk_test_ or sk_live_"
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                "https://api.stripe.com/v1/balance",
-                auth=(api_key, '')
-            )
+        client = get_http_client()
+        response = await client.get(
+            "https://api.stripe.com/v1/balance",
+            auth=(api_key, '')
+        )
+        
+        if response.status_code == 200:
+            return True, "Stripe credentials are valid"
+        elif response.status_code == 401:
+            return False, "Invalid API key"
+        else:
+            return False, f"API returned status {response.status_code}"
             
-            if response.status_code == 200:
-                return True, "Stripe credentials are valid"
-            elif response.status_code == 401:
-                return False, "Invalid API key"
-            else:
-                return False, f"API returned status {response.status_code}"
-                
     except Exception as e:
         return False, f"Test error: {str(e)[:100]}"
 
@@ -425,19 +444,19 @@ async def _test_twilio_credentials(credentials: Dict[str, Any]) -> Tuple[bool, s
         if not account_sid.startswith('AC'):
             return False, "Invalid account_sid format. Should start with 'AC'"
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}.json",
-                auth=(account_sid, auth_token)
-            )
+        client = get_http_client()
+        response = await client.get(
+            f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}.json",
+            auth=(account_sid, auth_token)
+        )
+        
+        if response.status_code == 200:
+            return True, "Twilio credentials are valid"
+        elif response.status_code == 401:
+            return False, "Invalid credentials"
+        else:
+            return False, f"API returned status {response.status_code}"
             
-            if response.status_code == 200:
-                return True, "Twilio credentials are valid"
-            elif response.status_code == 401:
-                return False, "Invalid credentials"
-            else:
-                return False, f"API returned status {response.status_code}"
-                
     except Exception as e:
         return False, f"Test error: {str(e)[:100]}"
 
@@ -453,19 +472,19 @@ async def _test_sendgrid_credentials(credentials: Dict[str, Any]) -> Tuple[bool,
         if not api_key.startswith('SG.'):
             return False, "Invalid API key format. SendGrid keys start with 'SG.'"
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                "https://api.sendgrid.com/v3/scopes",
-                headers={"Authorization": f"Bearer {api_key}"}
-            )
+        client = get_http_client()
+        response = await client.get(
+            "https://api.sendgrid.com/v3/scopes",
+            headers={"Authorization": f"Bearer {api_key}"}
+        )
+        
+        if response.status_code == 200:
+            return True, "SendGrid credentials are valid"
+        elif response.status_code == 401:
+            return False, "Invalid API key"
+        else:
+            return False, f"API returned status {response.status_code}"
             
-            if response.status_code == 200:
-                return True, "SendGrid credentials are valid"
-            elif response.status_code == 401:
-                return False, "Invalid API key"
-            else:
-                return False, f"API returned status {response.status_code}"
-                
     except Exception as e:
         return False, f"Test error: {str(e)[:100]}"
 
@@ -478,20 +497,20 @@ async def _test_discord_credentials(credentials: Dict[str, Any]) -> Tuple[bool,
         if not token:
             return False, "Missing bot_token"
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                "https://discord.com/api/v10/users/@me",
-                headers={"Authorization": f"Bot {token}"}
-            )
+        client = get_http_client()
+        response = await client.get(
+            "https://discord.com/api/v10/users/@me",
+            headers={"Authorization": f"Bot {token}"}
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            return True, f"Discord credentials valid for bot: {data.get('username', 'Unknown')}"
+        elif response.status_code == 401:
+            return False, "Invalid bot token"
+        else:
+            return False, f"API returned status {response.status_code}"
             
-            if response.status_code == 200:
-                data = response.json()
-                return True, f"Discord credentials valid for bot: {data.get('username', 'Unknown')}"
-            elif response.status_code == 401:
-                return False, "Invalid bot token"
-            else:
-                return False, f"API returned status {response.status_code}"
-                
     except Exception as e:
         return False, f"Test error: {str(e)[:100]}"
 
@@ -504,25 +523,25 @@ async def _test_dropbox_credentials(credentials: Dict[str, Any]) -> Tuple[bool,
         if not access_token:
             return False, "Missing access_token"
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                "https://api.dropboxapi.com/2/users/get_current_account",
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
+        client = get_http_client()
+        response = await client.post(
+            "https://api.dropboxapi.com/2/users/get_current_account",
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            return True, f"Dropbox credentials valid for: {data.get('email', 'Unknown')}"
+        elif response.status_code == 401:
+            return False, "Invalid access token"
+        else:
+            return False, f"API returned status {response.status_code}"
             
-            if response.status_code == 200:
-                data = response.json()
-                return True, f"Dropbox credentials valid for: {data.get('email', 'Unknown')}"
-            elif response.status_code == 401:
-                return False, "Invalid access token"
-            else:
-                return False, f"API returned status {response.status_code}"
-                
     except Exception as e:
         return False, f"Test error: {str(e)[:100]}"
 
 
-async def _test_aws_credentials(credentials: Dict[str, Any]) -> Tuple[bool, str]:
+def _validate_aws_format(credentials: Dict[str, Any]) -> Tuple[bool, str]:
     """Test AWS S3 credentials"""
     try:
         access_key_id = credentials.get('access_key_id', '')
@@ -541,7 +560,7 @@ async def _test_aws_credentials(credentials: Dict[str, Any]) -> Tuple[bool, str]
         return False, f"Validation error: {str(e)}"
 
 
-async def _test_generic_api_key(tool_name: str, credentials: Dict[str, Any]) -> Tuple[bool, str]:
+def _validate_generic_api_key(tool_name: str, credentials: Dict[str, Any]) -> Tuple[bool, str]:
     """Generic API key validation"""
     try:
         api_key = credentials.get('api_key', credentials.get('apiKey', ''))
@@ -564,7 +583,7 @@ async def _test_generic_api_key(tool_name: str, credentials: Dict[str, Any]) ->
         return False, f"Validation error: {str(e)}"
 
 
-async def _test_basic_validation(credentials: Dict[str, Any]) -> Tuple[bool, str]:
+def _validate_basic_credentials(credentials: Dict[str, Any]) -> Tuple[bool, str]:
     """Basic validation for unknown integration types"""
     try:
         if not credentials:
@@ -581,3 +600,24 @@ async def _test_basic_validation(credentials: Dict[str, Any]) -> Tuple[bool, str
     except Exception as e:
         return False, f"Validation error: {str(e)}"
 
+
+# Tool-name keywords -> credential tester, checked in order (first match wins)
+_CREDENTIAL_TESTERS = (
+    (('gmail', 'google'), _validate_google_format),
+    (('shopify',), _test_shopify_credentials),
+    (('airtable',), _test_airtable_credentials),
+    (('notion',), _test_notion_credentials),
+    (('postgres',), _test_postgresql_credentials),
+    (('mysql',), _test_mysql_credentials),
+    (('mongo',), _test_mongodb_credentials),
+    (('slack',), _test_slack_credentials),
+    (('github',), _test_github_credentials),
+    (('stripe',), _test_stripe_credentials),
+    (('twilio',), _test_twilio_credentials),
+    (('sendgrid',), _test_sendgrid_credentials),
+    (('discord',), _test_discord_credentials),
+    (('dropbox',), _test_dropbox_credentials),
+    (('aws', 's3'), _validate_aws_format),
+)
+# Testers that only check credential format (no network): called synchronously
+_FORMAT_VALIDATORS = frozenset({_validate_google_format, _validate_aws_format})
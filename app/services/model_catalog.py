@@ -1,134 +1,267 @@
-import time
+import asyncio
 import json
-import urllib.request
-from urllib.error import URLError, HTTPError
-from typing import List, Optional, Tuple
+import logging
+import os
+import stat
+import tempfile
+import time
+import httpx
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from cryptography.fernet import Fernet
+from app.config import settings
 from app.models.llm_provider import LLMProvider
+from app.services.http_client import get_http_client
 
-# Simple in-memory cache: {provider_id: (expires_at_epoch, [models])}
+# Simple in-memory LRU cache: {provider_id: (expires_at_monotonic, [models])}, least
+# recently used first. time.monotonic() so wall-clock steps can't expire or pin entries.
 _CACHE: dict[int, Tuple[float, List[str]]] = {}
+_CACHE_MAX_ENTRIES = 256
+# In-flight refreshes: {provider_id: task}. Concurrent cache misses for one provider
+# await the same fetch instead of each calling the provider's API
+_INFLIGHT: Dict[int, "asyncio.Task[List[str]]"] = {}
+# When a refresh fails, keep serving the expired list for this long before retrying
+_STALE_RETRY_SECONDS = 5 * 60
+# Fetched lists are also written to disk so other workers (and restarted ones) on this
+# host reuse them instead of re-hitting /models: one JSON file per provider, wall-clock TTL
+_DISK_CACHE_DIR = settings.model_cache_dir or os.path.join(tempfile.gettempdir(), "wrap-x-model-cache")
 
+logger = logging.getLogger(__name__)
 
-def _default_base_url(provider_name: str) -> Optional[str]:
-    name = (provider_name or "").lower()
-    if name == "openai":
-        return "https://api.openai.com/v1"
-    if name == "anthropic":
-        return "https://api.anthropic.com/v1"
-    if name == "deepseek":
-        return "https://api.deepseek.com/v1"
-    if name == "groq":
-        return "https://api.groq.com/openai/v1"
-    if name == "perplexity":
-        return "https://api.perplexity.ai"
-    if name == "together_ai" or name == "together":
-        return "https://api.together.xyz/v1"
-    if name == "openrouter":
-        return "https://openrouter.ai/api/v1"
-    if name == "mistral":
-        return "https://api.mistral.ai/v1"
-    if name == "cohere":
-        # Cohere model listing differs; allow fallback
-        return "https://api.cohere.ai/v1"
-    return None
-
-
-def _auth_header(provider: LLMProvider) -> dict:
-    name = (provider.provider_name or "").lower()
-    # Many providers are OpenAI-compatible (use Bearer key)
-    if name in {
-        "openai", "deepseek", "groq", "perplexity", "together_ai", "together",
-        "openrouter", "mistral"
-    }:
-        return {"Authorization": f"Bearer {provider.api_key}"}
+
+_BASE_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "anthropic": "https://api.anthropic.com/v1",
+    "deepseek": "https://api.deepseek.com/v1",
+    "groq": "https://api.groq.com/openai/v1",
+    "perplexity": "https://api.perplexity.ai",
+    "together_ai": "https://api.together.xyz/v1",
+    "together": "https://api.together.xyz/v1",
+    "openrouter": "https://openrouter.ai/api/v1",
+    "mistral": "https://api.mistral.ai/v1",
+    # Cohere model listing differs; allow fallback
+    "cohere": "https://api.cohere.ai/v1",
+}
+
+
+# Minimal per-provider model lists, used when the provider's /models can't be fetched
+_FALLBACK_MODELS: Dict[str, List[str]] = {
+    "openai": ["gpt-4o", "gpt-4o-mini"],
+    "anthropic": ["claude-3-5-sonnet", "claude-3-5-haiku"],
+    "deepseek": ["deepseek-chat", "deepseek-reasoner"],
+    "groq": ["groq/llama-3.1-8b-instant", "groq/llama-3.1-70b-versatile"],
+    "mistral": ["mistral-small", "mistral-medium", "mistral-large"],
+    "cohere": ["command", "command-r"],
+}
+
+
+def get_fallback_models(provider_name: Optional[str]) -> List[str]:
+    """Return the built-in model list for a provider name (empty if none is known)."""
+    return list(_FALLBACK_MODELS.get((provider_name or "").lower(), []))
+
+
+def _default_base_url(name: str) -> Optional[str]:
+    """Default API base for a lowercased provider name"""
+    return _BASE_URLS.get(name)
+
+
+@lru_cache(maxsize=4)
+def _cipher_for_key(key: bytes) -> Fernet:
+    # Keyed by the key bytes so a changed ENCRYPTION_KEY gets a new cipher
+    return Fernet(key)
+
+
+def _decrypt_stored_key(stored_key: str) -> str:
+    """Provider API keys are stored Fernet-encrypted; only the cipher is cached, never the key."""
+    encryption_key = settings.encryption_key
+    if not encryption_key:
+        return stored_key
+    try:
+        cipher = _cipher_for_key(encryption_key.encode() if isinstance(encryption_key, str) else encryption_key)
+        return cipher.decrypt(stored_key.encode()).decode()
+    except Exception:
+        # Not a token from this key (e.g. stored before encryption); send it as-is
+        return stored_key
+
+
+def _auth_header(provider: LLMProvider, name: str) -> dict:
+    api_key = _decrypt_stored_key(provider.api_key)
+    # Anthropic uses x-api-key; OpenAI-compatible providers, Cohere and unknown
+    # providers all take a Bearer key
     if name == "anthropic":
-        return {"x-api-key": provider.api_key}
-    if name == "cohere":
-        return {"Authorization": f"Bearer {provider.api_key}"}
-    # Default to Bearer
-    return {"Authorization": f"Bearer {provider.api_key}"}
-
-
-def _fetch_models_http(url: str, headers: dict) -> List[str]:
-    req = urllib.request.Request(url=url, headers=headers, method="GET")
-    with urllib.request.urlopen(req, timeout=20) as resp:
-        data = json.loads(resp.read().decode("utf-8"))
-    # Try common OpenAI-compatible shape
-    models = []
-    if isinstance(data, dict):
-        if isinstance(data.get("data"), list):
-            for item in data["data"]:
-                mid = item.get("id") or item.get("name")
-                if isinstance(mid, str):
-                    models.append(mid)
-        elif isinstance(data.get("models"), list):
-            # Some providers might return {models: []}
-            for item in data["models"]:
-                mid = item.get("id") or item.get("name")
-                if isinstance(mid, str):
-                    models.append(mid)
-    return models
+        return {"x-api-key": api_key}
+    return {"Authorization": f"Bearer {api_key}"}
+
+
+async def _fetch_models_http(url: str, headers: dict) -> List[str]:
+    resp = await get_http_client().get(url, headers=headers, timeout=20.0)
+    resp.raise_for_status()
+    data = resp.json()
+    if not isinstance(data, dict):
+        return []
+    # Try common OpenAI-compatible shape; some providers might return {models: []}
+    items = data.get("data")
+    if not isinstance(items, list):
+        items = data.get("models")
+        if not isinstance(items, list):
+            return []
+    return [mid for item in items if isinstance(mid := item.get("id") or item.get("name"), str)]
 
 
-def get_available_models(provider: LLMProvider, ttl_seconds: int = 6 * 60 * 60) -> List[str]:
-    now = time.time()
+async def get_available_models(provider: LLMProvider, ttl_seconds: int = 6 * 60 * 60) -> List[str]:
+    now = time.monotonic()
     cached = _CACHE.get(provider.id)
     if cached and cached[0] > now:
+        # Re-insert to mark as most recently used
+        _CACHE[provider.id] = _CACHE.pop(provider.id)
         return cached[1]
 
-    base = provider.api_base_url or _default_base_url(provider.provider_name)
+    task = _INFLIGHT.get(provider.id)
+    if task is None:
+        task = asyncio.create_task(_refresh_models(provider, ttl_seconds))
+        _INFLIGHT[provider.id] = task
+        task.add_done_callback(lambda _t, pid=provider.id: _INFLIGHT.pop(pid, None))
+    # shield: a cancelled caller must not cancel the fetch other callers are waiting on
+    return await asyncio.shield(task)
+
+
+def _disk_cache_dir() -> Optional[str]:
+    """
+    Create the disk cache directory if needed and return it, or None (disk cache off) unless
+    it is a real directory owned by this user with mode 0700. makedirs ignores mode for an
+    existing directory, so one pre-created by another local user could plant model lists.
+    """
+    try:
+        os.makedirs(_DISK_CACHE_DIR, mode=0o700, exist_ok=True)
+        st = os.lstat(_DISK_CACHE_DIR)
+    except OSError as e:
+        logger.debug(f"Model disk cache unavailable: {e}")
+        return None
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o700:
+        logger.warning(f"Model disk cache disabled: {_DISK_CACHE_DIR} is not a private directory owned by this user")
+        return None
+    return _DISK_CACHE_DIR
+
+
+def _disk_cache_path(cache_dir: str, provider_id: int) -> str:
+    return os.path.join(cache_dir, f"{int(provider_id)}.json")
+
+
+def _read_disk_cache(provider: LLMProvider) -> Optional[Tuple[float, List[str]]]:
+    """Return (seconds_left, models) from the shared disk cache, or None if missing/expired."""
+    cache_dir = _disk_cache_dir()
+    if cache_dir is None:
+        return None
+    try:
+        with open(_disk_cache_path(cache_dir, provider.id), encoding="utf-8") as f:
+            entry = json.load(f)
+        # Ids can be reused after a database reset; only trust entries for the same endpoint
+        if entry.get("provider_name") != provider.provider_name or entry.get("api_base_url") != provider.api_base_url:
+            return None
+        remaining = float(entry["expires_at"]) - time.time()
+        models = entry["models"]
+        if remaining <= 0 or not isinstance(models, list):
+            return None
+        return remaining, models
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.debug(f"Ignoring unreadable model cache for provider {provider.id}: {e}")
+        return None
+
+
+def _write_disk_cache(provider: LLMProvider, models: List[str], ttl_seconds: int) -> None:
+    entry = {
+        "provider_name": provider.provider_name,
+        "api_base_url": provider.api_base_url,
+        "expires_at": time.time() + ttl_seconds,
+        "models": models,
+    }
+    cache_dir = _disk_cache_dir()
+    if cache_dir is None:
+        return
+    try:
+        # Write then rename so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, _disk_cache_path(cache_dir, provider.id))
+    except Exception as e:
+        logger.debug(f"Could not write model cache for provider {provider.id}: {e}")
+
+
+async def _refresh_models(provider: LLMProvider, ttl_seconds: int) -> List[str]:
+    cached = _CACHE.get(provider.id)
+    # Another worker may have fetched this provider recently
+    from_disk = _read_disk_cache(provider)
+    if from_disk is not None:
+        remaining, models = from_disk
+        _store(provider.id, time.monotonic() + min(remaining, ttl_seconds), models)
+        return models
+
+    name = (provider.provider_name or "").lower()
+    base = provider.api_base_url or _default_base_url(name)
     models: List[str] = []
     if base:
         # Most providers colocate model listing at /models
         url = base.rstrip("/") + "/models"
-        headers = {
-            "Content-Type": "application/json",
-        }
-        headers.update(_auth_header(provider))
+        headers = _auth_header(provider, name)
         try:
-            models = _fetch_models_http(url, headers)
-        except (HTTPError, URLError, TimeoutError):
+            models = await _fetch_models_http(url, headers)
+        except httpx.HTTPError:
             models = []
         except Exception:
             models = []
+        if models:
+            _write_disk_cache(provider, models, ttl_seconds)
+
+    now = time.monotonic()
+    # Serve the last known list if the refresh came back empty (stale-if-error)
+    if not models and cached and cached[1]:
+        _CACHE[provider.id] = (now + _STALE_RETRY_SECONDS, cached[1])
+        return cached[1]
 
     # Fallback minimal lists per provider if none fetched
     if not models:
-        name = (provider.provider_name or "").lower()
-        if name == "openai":
-            models = [
-                "gpt-4o",
-                "gpt-4o-mini",
-            ]
-        elif name == "anthropic":
-            models = [
-                "claude-3-5-sonnet",
-                "claude-3-5-haiku",
-            ]
-        elif name == "deepseek":
-            models = [
-                "deepseek-chat",
-                "deepseek-reasoner",
-            ]
-        elif name == "groq":
-            models = [
-                "groq/llama-3.1-8b-instant",
-                "groq/llama-3.1-70b-versatile",
-            ]
-        elif name == "mistral":
-            models = [
-                "mistral-small",
-                "mistral-medium",
-                "mistral-large",
-            ]
-        elif name == "cohere":
-            models = [
-                "command",
-                "command-r",
-            ]
-        # else leave empty
-
-    # Cache
-    _CACHE[provider.id] = (now + ttl_seconds, models)
+        models = get_fallback_models(name)
+
+    _store(provider.id, now + ttl_seconds, models)
     return models
 
+
+def _store(provider_id: int, expires_at: float, models: List[str]) -> None:
+    """Cache models in memory, evicting the least recently used provider when full"""
+    _CACHE.pop(provider_id, None)
+    if len(_CACHE) >= _CACHE_MAX_ENTRIES:
+        _CACHE.pop(next(iter(_CACHE)))
+    _CACHE[provider_id] = (expires_at, models)
+
+
+def get_cached_models(provider_id: int) -> Optional[List[str]]:
+    """Return the last fetched models for a provider without making a request."""
+    cached = _CACHE.get(provider_id)
+    return cached[1] if cached else None
+
+
+def invalidate_cache(provider_id: Optional[int] = None) -> None:
+    """Drop cached models for one provider, or for all providers when no id is given."""
+    if provider_id is None:
+        _CACHE.clear()
+    else:
+        _CACHE.pop(provider_id, None)
+    cache_dir = _disk_cache_dir()
+    if cache_dir is None:
+        return
+    if provider_id is None:
+        try:
+            paths = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)]
+        except OSError:
+            paths = []
+    else:
+        paths = [_disk_cache_path(cache_dir, provider_id)]
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
@@ -1,7 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import Optional
-import json
 import logging
 from app.models.notification import Notification
 from app.models.notification_settings import NotificationSettings
@@ -19,6 +18,40 @@ DEFAULT_NOTIFICATION_SETTINGS = {
     "in_app_enabled": True
 }
 
+# Notification type -> settings flag that controls it
+NOTIFICATION_TYPE_SETTINGS = {
+    "api_error": "api_errors",
+    "rate_limit": "rate_limits",
+    "usage_threshold": "usage_thresholds",
+    "billing_alert": "billing_alerts",
+    "deployment_update": "deployment_updates",
+    "trial_activated": "billing_alerts",
+    "trial_ending": "billing_alerts",
+    "charge_succeeded": "billing_alerts",
+    "charge_failed": "billing_alerts",
+    "wrap_created": "deployment_updates",
+    "wrap_deployed": "deployment_updates",
+}
+
+
+def _settings_to_dict(settings_obj: NotificationSettings) -> dict:
+    return {
+        "api_errors": settings_obj.api_errors,
+        "rate_limits": settings_obj.rate_limits,
+        "usage_thresholds": settings_obj.usage_thresholds,
+        "billing_alerts": settings_obj.billing_alerts,
+        "deployment_updates": settings_obj.deployment_updates,
+        "in_app_enabled": settings_obj.in_app_enabled,
+    }
+
+
+def _is_notification_enabled(settings: dict, notification_type: str) -> bool:
+    # Check if in-app notifications are enabled
+    if not settings.get("in_app_enabled", True):
+        return False
+    setting_key = NOTIFICATION_TYPE_SETTINGS.get(notification_type, "in_app_enabled")
+    return settings.get(setting_key, True)
+
 
 async def get_user_notification_settings(user: User, db: AsyncSession) -> dict:
     """Get user's notification settings"""
@@ -30,14 +63,7 @@ async def get_user_notification_settings(user: User, db: AsyncSession) -> dict:
         settings_obj = result.scalar_one_or_none()
         
         if settings_obj:
-            return {
-                "api_errors": settings_obj.api_errors,
-                "rate_limits": settings_obj.rate_limits,
-                "usage_thresholds": settings_obj.usage_thresholds,
-                "billing_alerts": settings_obj.billing_alerts,
-                "deployment_updates": settings_obj.deployment_updates,
-                "in_app_enabled": settings_obj.in_app_enabled,
-            }
+            return _settings_to_dict(settings_obj)
         
         # Create default settings if none exist
         default_settings = NotificationSettings(
@@ -58,28 +84,7 @@ async def should_send_notification(user: User, notification_type: str, db: Async
     """Check if notification should be sent based on user preferences"""
     try:
         settings = await get_user_notification_settings(user, db)
-        
-        # Check if in-app notifications are enabled
-        if not settings.get("in_app_enabled", True):
-            return False
-        
-        # Map notification types to settings
-        type_mapping = {
-            "api_error": "api_errors",
-            "rate_limit": "rate_limits",
-            "usage_threshold": "usage_thresholds",
-            "billing_alert": "billing_alerts",
-            "deployment_update": "deployment_updates",
-            "trial_activated": "billing_alerts",
-            "trial_ending": "billing_alerts",
-            "charge_succeeded": "billing_alerts",
-            "charge_failed": "billing_alerts",
-            "wrap_created": "deployment_updates",
-            "wrap_deployed": "deployment_updates",
-        }
-        
-        setting_key = type_mapping.get(notification_type, "in_app_enabled")
-        return settings.get(setting_key, True)
+        return _is_notification_enabled(settings, notification_type)
     except Exception as e:
         logger.error(f"Error checking notification preference: {e}")
         return True  # Default to sending if check fails
@@ -96,17 +101,24 @@ async def create_notification(
 ) -> Optional[Notification]:
     """Create a notification if user preferences allow it"""
     try:
-        # Get user to check preferences
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
+        # Check the user exists and load their preferences in one round trip
+        result = await db.execute(
+            select(User.id, NotificationSettings)
+            .outerjoin(NotificationSettings, NotificationSettings.user_id == User.id)
+            .where(User.id == user_id)
+        )
+        row = result.first()
         
-        if not user:
+        if row is None:
             logger.warning(f"User {user_id} not found for notification")
             return None
         
+        # No settings row yet means defaults (the row is created when the user opens settings)
+        settings_obj = row[1]
+        settings = _settings_to_dict(settings_obj) if settings_obj else DEFAULT_NOTIFICATION_SETTINGS
+        
         # Check if notification should be sent
-        should_send = await should_send_notification(user, notification_type, db)
-        if not should_send:
+        if not _is_notification_enabled(settings, notification_type):
             logger.debug(f"Notification {notification_type} skipped for user {user_id} due to preferences")
             return None
         
@@ -117,7 +129,7 @@ async def create_notification(
             type=notification_type,
             title=title,
             message=message,
-            meta_data=json.dumps(metadata) if metadata else None,
+            meta_data=metadata or None,
             is_read=False
         )
         
@@ -1,11 +1,12 @@
 import secrets
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Sequence, Tuple
 from urllib.parse import urlencode
 
-import httpx
 from cryptography.fernet import Fernet
 
 from app.config import settings
+from app.services.http_client import get_http_client
 
 PROVIDER_KEYWORDS: Dict[str, Sequence[str]] = {
     "google": ("google", "gmail", "sheets", "drive", "calendar", "gworkspace"),
@@ -126,6 +127,12 @@ def _get_cipher() -> Fernet:
         raise ValueError("ENCRYPTION_KEY must be set to use OAuth helpers")
     if isinstance(key, str):
         key = key.encode()
+    return _cipher_for_key(key)
+
+
+@lru_cache(maxsize=4)
+def _cipher_for_key(key: bytes) -> Fernet:
+    # Keyed by the key bytes so a changed ENCRYPTION_KEY gets a new cipher
     return Fernet(key)
 
 
@@ -391,10 +398,9 @@ async def exchange_code_for_tokens(
     if extra:
         data.update(extra)
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        response = await client.post(config["token_url"], data=data)
-        response.raise_for_status()
-        return response.json()
+    response = await get_http_client().post(config["token_url"], data=data, timeout=20)
+    response.raise_for_status()
+    return response.json()
 
 
 async def refresh_access_token(
@@ -418,10 +424,9 @@ async def refresh_access_token(
     if redirect_url:
         data["redirect_uri"] = redirect_url
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        response = await client.post(config["token_url"], data=data)
-        response.raise_for_status()
-        return response.json()
+    response = await get_http_client().post(config["token_url"], data=data, timeout=20)
+    response.raise_for_status()
+    return response.json()
 
 
 def generate_state_token() -> str: